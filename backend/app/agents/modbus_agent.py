@@ -1,12 +1,18 @@
 # modbus_agent.py
 import minimalmodbus
 import time
+from typing import Any, Dict, List, Optional, Union
+from app.agents.register_map import RegisterMap, ReadBlock, decode_blocks, load_register_map
 
 class ModbusAgent:
-    def __init__(self, port: str, slave_address: int):
+    def __init__(self, port: str, slave_address: int, register_map: Optional[Union[RegisterMap, str]] = None):
         self.instrument = minimalmodbus.Instrument(port, slave_address)
         self.instrument.serial.baudrate = 9600
         self.instrument.serial.timeout = 1
+        self.register_map = load_register_map(register_map) if isinstance(register_map, str) else register_map
+        # Block reads planned once per map
+        self._plan: Optional[List[ReadBlock]] = self.register_map.plan() if self.register_map else None
+        self.last_poll = {"requests": 0, "failed_blocks": 0, "duration_ms": 0.0}
 
     def read_register(self, register: int, decimal_places: int = 0) -> float:
         try:
@@ -16,6 +22,27 @@ class ModbusAgent:
             print(f"Error reading register {register}: {e}")
             return None
 
+    def read_registers(self, start: int, count: int, function_code: int = 3) -> Optional[List[int]]:
+        """Read `count` consecutive raw registers in one request"""
+        try:
+            return self.instrument.read_registers(start, count, function_code)
+        except Exception as e:
+            print(f"Error reading registers {start}-{start + count - 1}: {e}")
+            return None
+
+    def poll(self) -> Dict[str, Any]:
+        """Read every value in the register map with the planned block reads"""
+        if self._plan is None:
+            raise ValueError("ModbusAgent has no register map to poll")
+        started = time.perf_counter()
+        results = [self.read_registers(block.start, block.count, block.function_code) for block in self._plan]
+        self.last_poll = {
+            "requests": len(self._plan),
+            "failed_blocks": sum(1 for words in results if words is None),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+        return decode_blocks(self._plan, results)
+
     def write_register(self, register: int, value: float, decimal_places: int = 0) -> bool:
         try:
             self.instrument.write_register(register, value, decimal_places)
@@ -25,6 +52,7 @@ class ModbusAgent:
             return False
 
 if __name__ == '__main__':
-    agent = ModbusAgent('/dev/ttyUSB0', 1)
+    agent = ModbusAgent('/dev/ttyUSB0', 1, register_map='generic_hybrid_inverter')
     print("Voltage:", agent.read_register(0))
+    print("Poll:", agent.poll(), agent.last_poll)
     print("Writing control signal:", agent.write_register(10, 1))
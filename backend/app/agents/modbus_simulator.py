@@ -0,0 +1,185 @@
+# modbus_simulator.py - Local Modbus TCP gateway simulator and polling benchmark
+import argparse
+import asyncio
+import random
+import time
+from typing import Any, Dict, Iterable, List, Optional
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusServerContext, ModbusSlaveContext
+from pymodbus.server import ModbusTcpServer
+from app.agents.register_map import RegisterMap, RegisterSpec, encode_value, load_register_map
+from app.services.modbus_poller import ModbusPoller
+
+# Plausible range (decoded units) per register unit; unitless values get 0-1000 raw counts
+VALUE_RANGES = {"V": (200, 250), "A": (0, 40), "Hz": (49.9, 50.1), "W": (0, 10000), "var": (-2000, 2000),
+                "VA": (0, 10000), "%": (10, 95), "C": (15, 45), "kWh": (0, 100000)}
+
+
+def _range(spec: RegisterSpec):
+    return VALUE_RANGES.get(spec.unit, (0, 1000 * spec.scale))
+
+
+class ModbusSimulator:
+    """A Modbus TCP gateway on `port` with one slave per unit id, all serving `register_map`.
+
+    Values start at random plausible levels and random-walk every
+    `update_interval` seconds. Units in `silent_units` are not served, so
+    requests to them time out the way a dead RTU slave behind a gateway does.
+    """
+
+    def __init__(
+        self,
+        register_map: RegisterMap,
+        units: Iterable[int] = range(1, 11),
+        host: str = "127.0.0.1",
+        port: int = 5020,
+        silent_units: Iterable[int] = (),
+        update_interval: float = 1.0,
+        seed: Optional[int] = None
+    ):
+        self.register_map = register_map
+        self.host = host
+        self.port = port
+        self.update_interval = update_interval
+        self.random = random.Random(seed)
+        silent = set(silent_units)
+        self.units = [unit for unit in units if unit not in silent]
+        size = max(spec.address + spec.count for spec in register_map.registers) + 1
+        self.slaves: Dict[int, ModbusSlaveContext] = {
+            unit: ModbusSlaveContext(
+                hr=ModbusSequentialDataBlock(0, [0] * size),
+                ir=ModbusSequentialDataBlock(0, [0] * size),
+                zero_mode=True,
+            )
+            for unit in self.units
+        }
+        self.values = {unit: {spec.name: self._initial(spec) for spec in register_map.registers} for unit in self.units}
+        for unit in self.units:
+            self._store(unit, register_map.registers)
+        self.server: Optional[ModbusTcpServer] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _initial(self, spec: RegisterSpec) -> float:
+        low, high = _range(spec)
+        return self.random.uniform(low, high)
+
+    def _store(self, unit: int, specs: Iterable[RegisterSpec]):
+        slave = self.slaves[unit]
+        for spec in specs:
+            table = 3 if spec.table == "holding" else 4
+            slave.setValues(table, spec.address, encode_value(spec, self.values[unit][spec.name]))
+
+    def _step(self):
+        """Random-walk every value within its range; energy counters only grow"""
+        for unit in self.units:
+            values = self.values[unit]
+            for spec in self.register_map.registers:
+                low, high = _range(spec)
+                if spec.unit == "kWh":
+                    values[spec.name] += self.random.uniform(0, 0.05)
+                else:
+                    values[spec.name] = min(high, max(low, values[spec.name] + self.random.gauss(0, (high - low) * 0.01)))
+            self._store(unit, self.register_map.registers)
+
+    async def start(self):
+        context = ModbusServerContext(slaves=self.slaves, single=False)
+        self.server = ModbusTcpServer(context, address=(self.host, self.port), ignore_missing_slaves=True)
+        await self.server.transport_listen()
+        if self.update_interval:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.update_interval)
+            self._step()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.server is not None:
+            await self.server.shutdown()
+            self.server = None
+
+
+async def run_benchmark(
+    model: str = "generic_hybrid_inverter",
+    gateways: int = 4,
+    units: int = 10,
+    seconds: float = 10.0,
+    base_port: int = 5020,
+    silent_units: Iterable[int] = (),
+    intervals: Optional[Dict[str, float]] = None
+) -> Dict[str, Any]:
+    """Poll `gateways` x `units` simulated devices for `seconds` and report throughput"""
+    register_map = load_register_map(model)
+    simulators = [
+        ModbusSimulator(register_map, range(1, units + 1), port=base_port + i, silent_units=silent_units, seed=i)
+        for i in range(gateways)
+    ]
+    for simulator in simulators:
+        await simulator.start()
+    received: Dict[str, int] = {}
+
+    async def sink(device_id: str, values: Dict[str, Any]):
+        received[device_id] = received.get(device_id, 0) + 1
+
+    poller = ModbusPoller(sink)
+    for i in range(gateways):
+        for unit in range(1, units + 1):
+            poller.add_device(f"gw{i}-u{unit}", register_map, unit=unit, host="127.0.0.1", port=base_port + i, intervals=intervals)
+    started = time.monotonic()
+    poller.start()
+    await asyncio.sleep(seconds)
+    elapsed = time.monotonic() - started
+    stats = poller.stats()
+    await poller.close()
+    for simulator in simulators:
+        await simulator.stop()
+
+    buses = list(stats["buses"].values())
+    requests = sum(bus["requests"] for bus in buses)
+    polls = sum(bus["polls"] for bus in buses)
+    return {
+        "devices": gateways * units,
+        "seconds": round(elapsed, 3),
+        "polls_per_s": round(polls / elapsed, 1),
+        "requests_per_s": round(requests / elapsed, 1),
+        "values_per_s": round(stats["values"] / elapsed, 1),
+        "devices_reporting": len(received),
+        "timeouts": sum(bus["timeouts"] for bus in buses),
+        "in_backoff": stats["in_backoff"],
+        "poll_ms_p50": max(bus["poll_ms"]["p50"] for bus in buses),
+        "poll_ms_p95": max(bus["poll_ms"]["p95"] for bus in buses),
+        "lag_ms_p95": max(bus["lag_ms"]["p95"] for bus in buses),
+        "lag_ms_max": max(bus["lag_ms"]["max"] for bus in buses),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Simulated Modbus TCP gateways for polling tests")
+    parser.add_argument("command", choices=("serve", "bench"))
+    parser.add_argument("--model", default="generic_hybrid_inverter")
+    parser.add_argument("--gateways", type=int, default=4)
+    parser.add_argument("--units", type=int, default=10, help="slaves per gateway")
+    parser.add_argument("--port", type=int, default=5020, help="first gateway port")
+    parser.add_argument("--silent", type=int, nargs="*", default=[], help="unit ids that never answer")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    async def serve():
+        register_map = load_register_map(args.model)
+        for i in range(args.gateways):
+            await ModbusSimulator(register_map, range(1, args.units + 1), port=args.port + i, silent_units=args.silent, seed=i).start()
+        print(f"Serving {args.gateways} gateways on ports {args.port}-{args.port + args.gateways - 1}, units 1-{args.units}")
+        await asyncio.Event().wait()
+
+    if args.command == "serve":
+        asyncio.run(serve())
+    else:
+        result = asyncio.run(run_benchmark(args.model, args.gateways, args.units, args.seconds, args.port, args.silent))
+        for key, value in result.items():
+            print(f"{key:>18}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,28 @@
 # anomaly.py
+# anomaly.py - Per-device-type anomaly model training and batch scoring API
+from fastapi import APIRouter, HTTPException
+from app.services.anomaly_detection import device_type_models, score_batch
+from app.models.request_models import AnomalyTrainRequest, AnomalyScoreRequest
+
+router = APIRouter()
+
+@router.post("/train")
+def train_anomaly_model(payload: AnomalyTrainRequest):
+    try:
+        return device_type_models.train(payload.device_type, payload.metrics, payload.contamination)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/score")
+def score_anomalies(payload: AnomalyScoreRequest):
+    try:
+        result = score_batch(payload.device_types, payload.metrics)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if payload.device_ids is not None:
+        result["device_ids"] = payload.device_ids
+    return result
+
+@router.get("/models")
+def get_anomaly_models():
+    return device_type_models.stats()
@@ -1,6 +1,11 @@
 # control.py - Execute EMS dispatch actions (Modbus, MQTT, etc)
-import json
-from app.services.mqtt import publish_control_message
+from typing import List, Optional, Sequence, Tuple
+from fastapi import APIRouter, HTTPException
+from app.models.request_models import BulkControlRequest, SiteControlRequest
+from app.services.command_dispatcher import ACTION_DECISIONS, command_dispatcher
+from app.services.schedule_engine import schedule_store
+
+router = APIRouter()
 
 MODBUS_REGISTERS = {
     "charge": 100,
@@ -9,21 +14,35 @@ MODBUS_REGISTERS = {
 }
 
 async def dispatch_command(decision: int, device_id: str):
-    if decision == -1:
-        action = "charge"
-    elif decision == 1:
-        action = "discharge"
-    else:
-        action = "idle"
-
-    payload = {
-        "device_id": device_id,
-        "action": action
-    }
-
-    # Option 1: MQTT command
-    await publish_control_message(device_id, json.dumps(payload))
-
-    # Option 2: Modbus (future)
-    # write_modbus_register(device_id, MODBUS_REGISTERS[action])
+    """Send one decision (-1 charge, 1 discharge, else idle) to a device and wait for its PUBACK"""
+    result = await dispatch_commands([(device_id, decision)])
+    return result["results"][0]
+
+async def dispatch_commands(commands: Sequence[Tuple[str, int]], device_ack: Optional[bool] = None):
+    """Send many (device_id, decision) commands as one batch"""
+    return await command_dispatcher.dispatch(commands, device_ack=device_ack)
+
+def _decision(action: str) -> int:
+    if action not in ACTION_DECISIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown action '{action}', expected one of {sorted(ACTION_DECISIONS)}")
+    return ACTION_DECISIONS[action]
+
+@router.post("/bulk")
+async def bulk_control(data: BulkControlRequest):
+    commands = [(item.device_id, _decision(item.action)) for item in data.commands]
+    return await dispatch_commands(commands, data.device_ack)
+
+# Whole-site command, e.g. "discharge now"; devices default to those scheduled on the site
+@router.post("/site/{site_id}")
+async def site_control(site_id: str, data: SiteControlRequest):
+    decision = _decision(data.action)
+    device_ids: List[str] = data.device_ids or list(schedule_store.site_actions(site_id))
+    if not device_ids:
+        raise HTTPException(status_code=404, detail=f"No devices known for site {site_id}")
+    result = await dispatch_commands([(device_id, decision) for device_id in device_ids], data.device_ack)
+    return {"site_id": site_id, **result}
+
+@router.get("/stats")
+def control_stats():
+    return command_dispatcher.stats()
 # control.py
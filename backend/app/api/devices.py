@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import uuid
 from ..services.device_connector import device_connector
 from ..services.supabase_service import supabase_service
+from ..services.telemetry_buffer import telemetry_buffer, compact_rows
+from ..services.telemetry_rollup import telemetry_rollup
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -134,11 +136,53 @@ async def send_device_command(
 @router.get("/devices/{device_id}/telemetry")
 async def get_device_telemetry(
     device_id: str,
-    limit: int = 100
+    limit: int = 100,
+    seconds: Optional[float] = None,
+    full: bool = False
 ):
-    """Get telemetry data for a device"""
+    """Get telemetry data for a device, newest first.
+
+    By default rows are compact: {device_id, timestamp, message, source}
+    with only the numeric fields of each message. They are served from the
+    in-memory ring buffer (source "buffer") and the database is only
+    queried, and its rows reduced to the same shape, when the buffer does
+    not hold enough history. With `full=true` the complete telemetry_log
+    rows (id, created_at, every message field) are read from the database.
+    """
     try:
-        telemetry = await supabase_service.get_device_telemetry(device_id, limit)
+        since = (datetime.utcnow() - timedelta(seconds=seconds)).isoformat() if seconds is not None else None
+        if full:
+            return await supabase_service.get_device_telemetry(device_id, limit, since=since)
+        if seconds is not None:
+            telemetry = telemetry_buffer.since(device_id, seconds, limit)
+        else:
+            telemetry = telemetry_buffer.latest(device_id, limit)
+        if telemetry is None:
+            telemetry = compact_rows(await supabase_service.get_device_telemetry(device_id, limit, since=since))
         return telemetry
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/devices/{device_id}/telemetry/rollup")
+async def get_device_telemetry_rollup(
+    device_id: str,
+    start: datetime,
+    end: Optional[datetime] = None,
+    metric: Optional[str] = None,
+    max_points: int = 500
+):
+    """Get aggregated telemetry (min/max/mean/last/count) for a time range.
+
+    Uses the finest of the 1m/15m/1h resolutions that returns at most
+    `max_points` buckets per metric. Times are UTC.
+    """
+    try:
+        start_ts = start.replace(tzinfo=start.tzinfo or timezone.utc).timestamp()
+        end_ts = end.replace(tzinfo=end.tzinfo or timezone.utc).timestamp() if end else datetime.now(timezone.utc).timestamp()
+        if end_ts <= start_ts:
+            raise HTTPException(status_code=400, detail="end must be after start")
+        return await telemetry_rollup.query(device_id, start_ts, end_ts, max_points, metric)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
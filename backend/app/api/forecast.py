@@ -1,8 +1,8 @@
 # forecast.py
 # forecast.py - Forecasting API for solar/load predictions
-from fastapi import APIRouter
-from app.services.forecasting import forecast_solar, forecast_load
-from app.models.request_models import ForecastRequest
+from fastapi import APIRouter, HTTPException
+from app.services.forecasting import forecast_solar, forecast_load, forecaster, KIND_COLUMNS
+from app.models.request_models import ForecastRequest, BatchForecastRequest
 
 router = APIRouter()
 
@@ -13,3 +13,10 @@ def get_solar_forecast(request: ForecastRequest):
 @router.post("/load")
 def get_load_forecast(request: ForecastRequest):
     return forecast_load(request.site_id, request.hours)
+
+@router.post("/batch")
+def get_batch_forecast(request: BatchForecastRequest):
+    unknown = [kind for kind in request.kinds if kind not in KIND_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown forecast kinds: {unknown}")
+    return forecaster.forecast_many(request.site_ids, request.hours, request.kinds)
@@ -0,0 +1,35 @@
+# metrics.py - Runtime counters for the ingestion and data-access pipeline
+from fastapi import APIRouter
+from app.services.broadcast_hub import broadcast_hub
+from app.services.command_dispatcher import command_dispatcher
+from app.services.device_connector import device_connector
+from app.services.device_presence import device_presence
+from app.services.forecasting import forecaster
+from app.services.online_anomaly import online_anomaly_detector
+from app.services.schedule_executor import schedule_executor
+from app.services.supabase_service import supabase_service
+from app.services.telemetry_buffer import telemetry_buffer
+from app.services.telemetry_rollup import telemetry_rollup
+from app.services.telemetry_stream import telemetry_stream
+from app.services.telemetry_writer import telemetry_writer
+
+router = APIRouter()
+
+@router.get("/")
+def get_metrics():
+    return {
+        "mqtt_ingestion": device_connector.ingestion_bridge.stats(),
+        "modbus_polling": device_connector.modbus_poller.stats(),
+        "telemetry_writer": telemetry_writer.stats(),
+        "device_presence": device_presence.stats(),
+        "device_cache": supabase_service.cache_stats(),
+        "supabase": supabase_service.executor.stats(),
+        "telemetry_buffer": telemetry_buffer.stats(),
+        "telemetry_rollup": telemetry_rollup.stats(),
+        "forecast_cache": forecaster.stats(),
+        "online_anomaly": online_anomaly_detector.stats(),
+        "websocket": broadcast_hub.stats(),
+        "telemetry_stream": telemetry_stream.stats(),
+        "schedule_executor": schedule_executor.stats(),
+        "command_dispatch": command_dispatcher.stats(),
+    }
@@ -1,8 +1,9 @@
 # optimize.py
 # optimize.py - Energy optimization and dispatch decision API
-from fastapi import APIRouter
-from app.services.optimization import optimize_dispatch
-from app.models.request_models import OptimizationRequest
+from fastapi import APIRouter, HTTPException
+from app.services.optimization import optimize_dispatch, optimize_dispatch_batch
+from app.services.horizon_optimizer import horizon_optimizer, SiteBatteryState
+from app.models.request_models import OptimizationRequest, BatchOptimizationRequest, HorizonOptimizationRequest
 
 router = APIRouter()
 
@@ -10,3 +11,21 @@ router = APIRouter()
 def run_optimization(payload: OptimizationRequest):
     result = optimize_dispatch(payload)
     return result
+
+@router.post("/batch")
+def run_batch_optimization(payload: BatchOptimizationRequest):
+    try:
+        return optimize_dispatch_batch(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/horizon")
+def run_horizon_optimization(payload: HorizonOptimizationRequest):
+    sites = [
+        SiteBatteryState(**{k: v for k, v in site.dict().items() if v is not None})
+        for site in payload.sites
+    ]
+    try:
+        return horizon_optimizer.solve(sites, start=payload.start, parallel=payload.parallel)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -2,7 +2,7 @@
 # routes.py - Central API registration for EMS
 from fastapi import APIRouter
 from app.api import (
-    devices, sites, schedule, alerts, forecast, optimize, train, roi, ocpi_sessions
+    devices, sites, schedule, alerts, forecast, optimize, train, roi, ocpi_sessions, metrics, anomaly, control
 )
 
 router = APIRouter()
@@ -16,3 +16,6 @@ router.include_router(optimize.router, prefix="/api/optimize")
 router.include_router(train.router, prefix="/api/train")
 router.include_router(roi.router, prefix="/api/roi")
 router.include_router(ocpi_sessions.router, prefix="/api/ocpi")
+router.include_router(metrics.router, prefix="/api/metrics")
+router.include_router(anomaly.router, prefix="/api/anomaly")
+router.include_router(control.router, prefix="/api/control")
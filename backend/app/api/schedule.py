@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import List
-from app.services.schedule_engine import schedule_action, get_schedule, get_action_for_current_hour
+from typing import List, Optional
+from app.services.schedule_engine import schedule_store, get_schedule, get_action_for_current_hour
+from app.services.schedule_executor import schedule_executor
 
 router = APIRouter(prefix="/api/schedule")
 
@@ -12,13 +13,33 @@ class ScheduleItem(BaseModel):
 class DeviceScheduleRequest(BaseModel):
     device_id: str
     schedule: List[ScheduleItem]
+    site_id: Optional[str] = None
+
+class DayScheduleItem(BaseModel):
+    device_id: str
+    actions: List[str]          # one per slot: 24 for hourly, 96 for 15-minute
+    resolution: int = 60
+    site_id: Optional[str] = None
+
+class BulkScheduleRequest(BaseModel):
+    schedules: List[DayScheduleItem]
 
 @router.post("/set")
 def set_schedule(data: DeviceScheduleRequest):
-    for item in data.schedule:
-        schedule_action(data.device_id, item.hour, item.action)
+    try:
+        schedule_store.set_slots(data.device_id, [(item.hour, item.action) for item in data.schedule], site_id=data.site_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"message": f"Schedule set for {data.device_id}"}
 
+@router.post("/bulk")
+def set_day_schedules(data: BulkScheduleRequest):
+    try:
+        schedule_store.set_days([(s.device_id, s.actions, s.resolution, s.site_id) for s in data.schedules])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": f"Schedules set for {len(data.schedules)} devices"}
+
 @router.get("/get/{device_id}")
 def get_device_schedule(device_id: str):
     return get_schedule(device_id)
@@ -26,3 +47,11 @@ def get_device_schedule(device_id: str):
 @router.get("/current/{device_id}")
 def current_hour_action(device_id: str):
     return {"action": get_action_for_current_hour(device_id)}
+
+@router.get("/site/{site_id}/current")
+def current_site_actions(site_id: str):
+    return {"site_id": site_id, "actions": schedule_store.site_actions(site_id)}
+
+@router.get("/executor")
+def executor_status():
+    return schedule_executor.stats()
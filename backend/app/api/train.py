@@ -2,10 +2,17 @@
 # train.py - ML model training API for energy optimization
 from fastapi import APIRouter
 from app.services.model_trainer import train_dispatch_model
+from app.services.ai_advisor import reload_model
+from app.services.model_registry import model_registry
 
 router = APIRouter()
 
 @router.post("/")
-def trigger_training():
-    score = train_dispatch_model()
-    return {"message": "Training complete", "model_accuracy_r2": score}
+def trigger_training(full_refit: bool = False):
+    report = train_dispatch_model(full_refit=full_refit)
+    reload_model()
+    return {"message": "Training complete", "model_accuracy_r2": report["r2"], **report}
+
+@router.get("/models")
+def served_models():
+    return model_registry.info()
@@ -1,26 +1,38 @@
 # websocket.py - Real-time WebSocket alert + telemetry bridge
+import json
 from fastapi import WebSocket, APIRouter, WebSocketDisconnect
+from app.services.broadcast_hub import broadcast_hub
+from app.services.telemetry_stream import telemetry_stream
 
 router = APIRouter()
-clients = set()
 
+# Clients send {"action": "subscribe", "devices": [...], "sites": [...], "metrics": [...],
+# "max_rate": 2, "delta": true} to receive live telemetry; other text keeps the connection alive
 @router.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
-    await ws.accept()
-    clients.add(ws)
+    client = await broadcast_hub.connect(ws)
     try:
         while True:
-            await ws.receive_text()  # Keep connection alive (or use ping)
+            text = await ws.receive_text()
+            try:
+                command = json.loads(text)
+            except ValueError:
+                continue
+            if isinstance(command, dict) and "action" in command:
+                try:
+                    ack = telemetry_stream.handle(client, command)
+                except (TypeError, ValueError) as e:
+                    ack = {"type": "error", "detail": str(e)}
+                broadcast_hub.send(client, json.dumps(ack))
     except WebSocketDisconnect:
-        clients.remove(ws)
+        pass
+    finally:
+        telemetry_stream.remove(client)
+        broadcast_hub.disconnect(client)
 
-# Broadcast helper
+# Broadcast helper; queues the alert for every client without waiting on slow ones
 async def broadcast_alert(message: dict):
-    for client in list(clients):
-        try:
-            await client.send_json(message)
-        except:
-            clients.remove(client)
+    return broadcast_hub.broadcast(message, essential=True)
 
 # Advanced admin commands
 @router.get("/ping")
@@ -29,4 +41,4 @@ def ping():
 
 @router.get("/clients")
 def active_clients():
-    return {"connected_clients": len(clients)}
+    return {"connected_clients": len(broadcast_hub.clients), **broadcast_hub.stats()}
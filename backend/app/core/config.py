@@ -13,4 +13,88 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 
 # Default configurations
 DEFAULT_TARIF_RATE = 0.45  # Example for base tariff
+
+# Telemetry batch writer
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "500"))
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "1.0"))  # seconds
+TELEMETRY_MAX_QUEUE = int(os.getenv("TELEMETRY_MAX_QUEUE", "20000"))
+
+# Device status / last_seen coalescing
+DEVICE_STATUS_FLUSH_INTERVAL = float(os.getenv("DEVICE_STATUS_FLUSH_INTERVAL", "10.0"))  # seconds
+DEVICE_LAST_SEEN_GRANULARITY = float(os.getenv("DEVICE_LAST_SEEN_GRANULARITY", "60.0"))  # seconds
+
+# Device metadata cache
+DEVICE_CACHE_MAX_SIZE = int(os.getenv("DEVICE_CACHE_MAX_SIZE", "10000"))
+DEVICE_CACHE_TTL = float(os.getenv("DEVICE_CACHE_TTL", "60.0"))  # seconds
+
+# MQTT ingestion bridge
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "8"))
+INGEST_OVERFLOW_POLICY = os.getenv("INGEST_OVERFLOW_POLICY", "drop_oldest")  # block | drop_oldest | drop_newest
+INGEST_BLOCK_TIMEOUT = float(os.getenv("INGEST_BLOCK_TIMEOUT", "5.0"))  # seconds the "block" policy may hold paho's thread
+
+# Supabase data access
+SUPABASE_MAX_CONCURRENCY = int(os.getenv("SUPABASE_MAX_CONCURRENCY", "16"))
+SUPABASE_CALL_TIMEOUT = float(os.getenv("SUPABASE_CALL_TIMEOUT", "10.0"))  # seconds
+
+# Recent telemetry ring buffer (memory per device <= capacity * 8 * (1 + max_metrics) bytes)
+TELEMETRY_BUFFER_CAPACITY = int(os.getenv("TELEMETRY_BUFFER_CAPACITY", "360"))
+TELEMETRY_BUFFER_MAX_METRICS = int(os.getenv("TELEMETRY_BUFFER_MAX_METRICS", "16"))
+TELEMETRY_BUFFER_MAX_DEVICES = int(os.getenv("TELEMETRY_BUFFER_MAX_DEVICES", "10000"))
+
+# Telemetry rollups
+ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", "30.0"))  # seconds
+ROLLUP_MAX_PENDING = int(os.getenv("ROLLUP_MAX_PENDING", "200000"))  # closed buckets awaiting write
+
+# Optimization history writer
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "1.0"))  # seconds
+HISTORY_MAX_BUFFERED_LINES = int(os.getenv("HISTORY_MAX_BUFFERED_LINES", "5000"))
+HISTORY_ROTATE_BYTES = int(os.getenv("HISTORY_ROTATE_BYTES", str(64 * 1024 * 1024)))  # 0 disables size rotation
+HISTORY_ROTATE_DAILY = os.getenv("HISTORY_ROTATE_DAILY", "true").lower() == "true"
+
+# Solar/load forecasting
+FORECAST_HISTORY_DAYS = int(os.getenv("FORECAST_HISTORY_DAYS", "28"))  # rounded up to whole weeks
+FORECAST_SMOOTHING = float(os.getenv("FORECAST_SMOOTHING", "0.3"))  # weight of the most recent season
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "20000"))  # sites
+FORECAST_MAX_HOURS = int(os.getenv("FORECAST_MAX_HOURS", "168"))  # longest horizon a request may ask for
+
+# Streaming anomaly detection (state per device-metric is a fixed 48 bytes plus its index entry)
+ANOMALY_MAX_SERIES = int(os.getenv("ANOMALY_MAX_SERIES", "50000"))
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.05"))  # EWMA weight of the newest value
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "4.0"))
+ANOMALY_WARMUP = int(os.getenv("ANOMALY_WARMUP", "30"))  # samples before a series is scored
+ANOMALY_ALERT_COOLDOWN = float(os.getenv("ANOMALY_ALERT_COOLDOWN", "300.0"))  # seconds per device-metric
+ANOMALY_MODEL_CACHE_BYTES = int(os.getenv("ANOMALY_MODEL_CACHE_BYTES", str(256 * 1024 * 1024)))  # per-device-type models
+
+# WebSocket broadcast hub
+WS_CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE_SIZE", "256"))  # messages per client
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5.0"))  # seconds
+WS_MAX_OVERFLOWS = int(os.getenv("WS_MAX_OVERFLOWS", "3"))  # overflows before downgrade, then eviction
+
+# Live telemetry streaming over WebSocket
+STREAM_DEFAULT_RATE = float(os.getenv("STREAM_DEFAULT_RATE", "1.0"))  # frames per second per client
+STREAM_MAX_RATE = float(os.getenv("STREAM_MAX_RATE", "10.0"))
+STREAM_TICK = float(os.getenv("STREAM_TICK", "0.05"))  # seconds between flush passes
+
+# Device command dispatch (MQTT)
+COMMAND_QOS = int(os.getenv("COMMAND_QOS", "1"))
+COMMAND_ACK_TIMEOUT = float(os.getenv("COMMAND_ACK_TIMEOUT", "2.0"))  # seconds per attempt
+COMMAND_RETRIES = int(os.getenv("COMMAND_RETRIES", "2"))  # re-publishes after the first attempt
+COMMAND_DEVICE_ACK = os.getenv("COMMAND_DEVICE_ACK", "false").lower() == "true"  # wait for devices/<id>/ack
+COMMAND_MAX_INFLIGHT = int(os.getenv("COMMAND_MAX_INFLIGHT", "0"))  # unacknowledged QoS 1 publishes; 0 = unlimited
+
+# Modbus polling
+MODBUS_TIMEOUT = float(os.getenv("MODBUS_TIMEOUT", "1.0"))  # seconds per request
+MODBUS_DEFAULT_INTERVAL = float(os.getenv("MODBUS_DEFAULT_INTERVAL", "5.0"))  # seconds, groups without one in the map
+MODBUS_GATEWAY_CONCURRENCY = int(os.getenv("MODBUS_GATEWAY_CONCURRENCY", "1"))  # in-flight requests per TCP gateway
+MODBUS_BACKOFF_AFTER = int(os.getenv("MODBUS_BACKOFF_AFTER", "3"))  # consecutive failed polls
+MODBUS_BACKOFF_BASE = float(os.getenv("MODBUS_BACKOFF_BASE", "5.0"))  # seconds, doubled per further failure
+MODBUS_BACKOFF_MAX = float(os.getenv("MODBUS_BACKOFF_MAX", "300.0"))
+# Register map per device type, "type=map,type=map"; types not listed use the map named after the type
+MODBUS_REGISTER_MAPS = dict(
+    item.split("=", 1) for item in os.getenv("MODBUS_REGISTER_MAPS", "inverter=generic_hybrid_inverter").split(",") if "=" in item
+)
+
+# In-memory alert store
+ALERT_MAX_STORED = int(os.getenv("ALERT_MAX_STORED", "1000"))
 # config.py
@@ -1,5 +1,8 @@
 # request_models.py - Define request models for input validation (Pydantic)
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.core.config import FORECAST_MAX_HOURS
 
 # Request model for calculating ROI
 class ROICalculationRequest(BaseModel):
@@ -18,4 +21,87 @@ class OCPIStartRequest(BaseModel):
 # Request model for OCPI session stop
 class OCPIStopRequest(BaseModel):
     session_id: str
+
+# Request model for raising an alert manually
+class AlertCreateRequest(BaseModel):
+    type: str
+    message: str
+    severity: str = "warning"
+    device_id: Optional[str] = None
+    details: Optional[Dict[str, Any]] = None
+
+# Request model for training a device-type anomaly model; one list per metric
+class AnomalyTrainRequest(BaseModel):
+    device_type: str
+    metrics: Dict[str, List[float]]
+    contamination: float = 0.01
+
+# Request model for columnar batch anomaly scoring; row i of every list is one reading
+class AnomalyScoreRequest(BaseModel):
+    device_types: List[str]
+    metrics: Dict[str, List[Optional[float]]]
+    device_ids: Optional[List[str]] = None
+
+# Request model for a single-site solar/load forecast
+class ForecastRequest(BaseModel):
+    site_id: str
+    hours: int = Field(24, ge=1, le=FORECAST_MAX_HOURS)
+
+# Request model for forecasting many sites in one call
+class BatchForecastRequest(BaseModel):
+    site_ids: List[str]
+    hours: int = Field(24, ge=1, le=FORECAST_MAX_HOURS)
+    kinds: List[str] = ["solar", "load"]
+
+# Request model for a single-site dispatch decision
+class OptimizationRequest(BaseModel):
+    soc: float
+    pv_kw: float
+    load_kw: float
+
+# Request model for fleet-wide dispatch; one array element per site
+class BatchOptimizationRequest(BaseModel):
+    soc: List[float]
+    pv_kw: List[float]
+    load_kw: List[float]
+    site_ids: Optional[List[str]] = None
+
+# Battery state and (optional) 96-slot profiles of one site for 24h planning
+class SiteHorizonState(BaseModel):
+    site_id: str
+    soc: float
+    capacity_kwh: Optional[float] = None
+    max_charge_kw: float = 50.0
+    max_discharge_kw: float = 50.0
+    soc_min: float = 10.0
+    soc_max: float = 95.0
+    round_trip_efficiency: float = 0.9
+    cycles: int = 0
+    depth_of_discharge: float = 0.8
+    temperature: float = 25.0
+    pv_kw: Optional[List[float]] = None
+    load_kw: Optional[List[float]] = None
+    import_price: Optional[List[float]] = None
+    export_price: Optional[float] = None
+
+# Request model for multi-period (24h, 15-minute slot) dispatch planning
+class HorizonOptimizationRequest(BaseModel):
+    sites: List[SiteHorizonState]
+    start: Optional[datetime] = None
+    parallel: bool = True
+
+# One device command for bulk control (action: charge | discharge | idle)
+class ControlCommand(BaseModel):
+    device_id: str
+    action: str
+
+class BulkControlRequest(BaseModel):
+    commands: List[ControlCommand]
+    device_ack: Optional[bool] = None   # also wait for devices/<id>/ack; defaults to COMMAND_DEVICE_ACK
+
+class SiteControlRequest(BaseModel):
+    action: str
+    device_ids: Optional[List[str]] = None
+    device_ack: Optional[bool] = None
+
 # request_models.py
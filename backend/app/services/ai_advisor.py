@@ -1,15 +1,19 @@
 # ai_advisor.py - Predict battery dispatch using ML
-import joblib
-import os
 import numpy as np
 from pathlib import Path
+from app.services.model_registry import model_registry
 
 MODEL_PATH = Path("app/data/models/dispatch_model.pkl")
+DISPATCH_MODEL = "dispatch"
+
+model_registry.register(DISPATCH_MODEL, MODEL_PATH)
 
 def load_model():
-    if MODEL_PATH.exists():
-        return joblib.load(MODEL_PATH)
-    return None
+    return model_registry.get(DISPATCH_MODEL)
+
+def reload_model():
+    """Pick up a freshly trained model now instead of on the next mtime check"""
+    return model_registry.refresh(DISPATCH_MODEL)
 
 def ai_recommend_dispatch(input_features: dict):
     model = load_model()
@@ -24,4 +28,12 @@ def ai_recommend_dispatch(input_features: dict):
     ]])
 
     prediction = model.predict(X)[0]  # e.g., -1=charge, 0=idle, 1=discharge
-    return {"dispatch_decision": prediction}# ai_advisor.py
+    return {"dispatch_decision": prediction}
+
+def ai_recommend_dispatch_batch(load: np.ndarray, pv: np.ndarray, tariff: np.ndarray, soc: np.ndarray):
+    """One model.predict over all sites; returns None if no model is trained"""
+    model = load_model()
+    if not model:
+        return None
+    X = np.column_stack([load, pv, tariff, soc])
+    return model.predict(X)# ai_advisor.py
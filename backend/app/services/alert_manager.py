@@ -1 +1,50 @@
+# alert_manager.py - In-memory store of recent system alerts
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.core.config import ALERT_MAX_STORED
+
+_alerts: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def raise_alert(
+    alert_type: str,
+    message: str,
+    severity: str = "warning",
+    device_id: Optional[str] = None,
+    details: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Record an alert; the oldest ones are dropped beyond ALERT_MAX_STORED"""
+    alert = {
+        "id": str(uuid.uuid4()),
+        "type": alert_type,
+        "severity": severity,
+        "device_id": device_id,
+        "message": message,
+        "details": details or {},
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+    with _lock:
+        _alerts[alert["id"]] = alert
+        while len(_alerts) > ALERT_MAX_STORED:
+            _alerts.popitem(last=False)
+    return alert
+
+
+def get_alerts() -> List[Dict[str, Any]]:
+    """Stored alerts, newest first"""
+    with _lock:
+        return list(reversed(_alerts.values()))
+
+
+def create_alert(alert) -> Dict[str, Any]:
+    return raise_alert(alert.type, alert.message, alert.severity, alert.device_id, alert.details)
+
+
+def delete_alert(alert_id: str) -> bool:
+    with _lock:
+        return _alerts.pop(alert_id, None) is not None
 # alert_manager.py
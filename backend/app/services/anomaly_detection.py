@@ -1,23 +1,189 @@
 # anomaly_detection.py - Anomaly detection engine for EMS
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import joblib
 import numpy as np
 from sklearn.ensemble import IsolationForest
+from app.core.config import ANOMALY_MODEL_CACHE_BYTES
 from app.services.history_logger import log_dispatch_result
 
+MODEL_DIR = Path("app/data/models/anomaly")
+DEVICE_TYPE_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def _as_matrix(data) -> np.ndarray:
+    """Accept a list of {'value': x} dicts (legacy), a 1-D array or a 2-D feature matrix"""
+    if isinstance(data, list) and data and isinstance(data[0], dict):
+        data = [d['value'] for d in data]
+    X = np.asarray(data, dtype=np.float64)
+    return X.reshape(-1, 1) if X.ndim == 1 else X
+
 # Example of anomaly detection using IsolationForest
 class AnomalyDetector:
     def __init__(self, n_estimators=100, contamination=0.1):
         self.model = IsolationForest(n_estimators=n_estimators, contamination=contamination)
 
     def fit(self, data):
-        X = np.array([d['value'] for d in data]).reshape(-1, 1)
-        self.model.fit(X)
+        self.model.fit(_as_matrix(data))
 
     def predict(self, data):
-        X = np.array([d['value'] for d in data]).reshape(-1, 1)
-        return self.model.predict(X)  # 1: anomaly, -1: normal
+        return self.model.predict(_as_matrix(data))  # -1: anomaly, 1: normal
 
 anomaly_detector = AnomalyDetector()
 
+
+class DeviceTypeModels:
+    """One IsolationForest per device type, persisted and cached in memory.
+
+    Models are stored as `MODEL_DIR/<device_type>.pkl` and loaded on first
+    use. The cache is bounded by the total size of the loaded model files
+    (`max_bytes`); the least recently used type is dropped first. A file
+    that changed on disk since it was loaded is reloaded on the next use.
+    """
+
+    def __init__(self, root: Path = MODEL_DIR, max_bytes: int = ANOMALY_MODEL_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def path(self, device_type: str) -> Path:
+        # The type becomes a file name; refuse anything that could leave MODEL_DIR
+        if not DEVICE_TYPE_PATTERN.fullmatch(device_type):
+            raise ValueError(f"Invalid device type '{device_type}'")
+        return self.root / f"{device_type}.pkl"
+
+    def train(
+        self,
+        device_type: str,
+        metrics: Dict[str, Sequence[float]],
+        contamination: float = 0.01,
+        n_estimators: int = 100
+    ) -> Dict[str, Any]:
+        """Fit on columnar readings of one device type and persist the model"""
+        features = sorted(metrics)
+        X = np.column_stack([np.asarray(metrics[f], dtype=np.float64) for f in features])
+        X = X[~np.isnan(X).any(axis=1)]
+        if len(X) < 2:
+            raise ValueError(f"Not enough complete readings to train a {device_type} model")
+        model = IsolationForest(n_estimators=n_estimators, contamination=contamination, n_jobs=-1, random_state=0)
+        model.fit(X)
+        entry = {
+            "model": model,
+            "features": features,
+            # Missing metrics at scoring time are imputed with the training median
+            "fill": np.median(X, axis=0),
+            "rows": len(X),
+            "trained_at": datetime.utcnow().isoformat(),
+        }
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.path(device_type)
+        tmp = path.with_suffix(".pkl.tmp")
+        joblib.dump(entry, tmp)
+        tmp.replace(path)
+        with self._lock:
+            self._drop(device_type)
+        return {k: entry[k] for k in ("features", "rows", "trained_at")}
+
+    def _drop(self, device_type: str):
+        cached = self._entries.pop(device_type, None)
+        if cached is not None:
+            self._bytes -= cached["bytes"]
+
+    def get(self, device_type: str) -> Optional[Dict[str, Any]]:
+        """Model entry for a device type, or None if none has been trained"""
+        path = self.path(device_type)
+        with self._lock:
+            try:
+                mtime = path.stat().st_mtime_ns
+            except FileNotFoundError:
+                self._drop(device_type)
+                return None
+            cached = self._entries.get(device_type)
+            if cached is not None and cached["mtime"] == mtime:
+                self._entries.move_to_end(device_type)
+                return cached["entry"]
+            self._drop(device_type)
+            entry = joblib.load(path)
+            size = path.stat().st_size
+            self._entries[device_type] = {"entry": entry, "mtime": mtime, "bytes": size}
+            self._bytes += size
+            self.loads += 1
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted["bytes"]
+                self.evictions += 1
+            return entry
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached_types": list(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+# Create a singleton instance
+device_type_models = DeviceTypeModels()
+
+
+def score_batch(device_types: Sequence[str], metrics: Dict[str, Sequence[Optional[float]]]) -> Dict[str, Any]:
+    """Score columnar readings from many devices in one pass.
+
+    Row i is a reading from a device of type `device_types[i]` with values
+    `metrics[name][i]` (None/NaN when missing). Rows are grouped by type
+    with one `np.unique`, and each type's rows go through its model in a
+    single call. Returns per-row `score` (lower is more anomalous, < 0 is
+    an anomaly, None when unscored), `is_anomaly` and `scored`; rows whose
+    type has no trained model are left unscored and listed under
+    `untrained_types`, and rows whose type is not a valid model name under
+    `invalid_types`.
+    """
+    types = np.asarray(device_types, dtype=object)
+    n = len(types)
+    columns = {name: np.asarray(values, dtype=np.float64) for name, values in metrics.items()}
+    for name, column in columns.items():
+        if len(column) != n:
+            raise ValueError(f"Metric '{name}' has {len(column)} values, expected {n}")
+
+    scores = np.full(n, np.nan)
+    untrained, invalid = [], []
+    if n:
+        uniq, inverse = np.unique(types.astype(str), return_inverse=True)
+        for k, device_type in enumerate(uniq.tolist()):
+            try:
+                entry = device_type_models.get(device_type)
+            except ValueError:
+                invalid.append(device_type)
+                continue
+            if entry is None:
+                untrained.append(device_type)
+                continue
+            rows = np.flatnonzero(inverse == k)
+            X = np.column_stack([
+                columns[f][rows] if f in columns else np.full(len(rows), np.nan) for f in entry["features"]
+            ])
+            X = np.where(np.isnan(X), entry["fill"][None, :], X)
+            scores[rows] = entry["model"].decision_function(X)
+
+    scored = ~np.isnan(scores)
+    return {
+        # None, not NaN, for unscored rows so the result stays valid JSON
+        "score": [round(float(score), 6) if ok else None for score, ok in zip(scores, scored)],
+        "is_anomaly": (scored & (scores < 0)).tolist(),
+        "scored": scored.tolist(),
+        "untrained_types": untrained,
+        "invalid_types": invalid,
+    }
+
 # Example: Detect anomalies based on deviation from expected behavior
 def detect_anomaly(actual_value, expected_value):
     deviation = abs(actual_value - expected_value)
@@ -26,11 +192,12 @@ def detect_anomaly(actual_value, expected_value):
 
 # Batch processing anomaly detection
 def detect_batch_anomalies(readings):
-    anomalies = []
-    for reading in readings:
-        if detect_anomaly(reading['actual'], reading['expected']):
-            anomalies.append(reading)
-    return anomalies
+    if not readings:
+        return []
+    actual = np.array([reading['actual'] for reading in readings], dtype=np.float64)
+    expected = np.array([reading['expected'] for reading in readings], dtype=np.float64)
+    flagged = np.flatnonzero(np.abs(actual - expected) > 0.2 * expected)
+    return [readings[i] for i in flagged]
 
 # Log detected anomalies
 def log_anomalies(anomalies):
@@ -0,0 +1,140 @@
+# billing.py - Bulk interval-data billing on top of the tariff engine
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Union
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+from app.services.tariff_engine import DEFAULT_TARIFF, TariffDefinition, compile_tariff
+
+METER_COLUMNS = ["site_id", "timestamp", "import_kwh", "export_kwh"]
+BREAKDOWN_COLUMNS = [
+    "site_id", "month", "period", "import_kwh", "export_kwh", "energy_charge", "feed_in_credit"
+]
+# Rows per chunk; about 50 MB of meter columns
+CHUNK_ROWS = 1_000_000
+
+
+def _partial_bill(df: pd.DataFrame, definition: TariffDefinition) -> pd.DataFrame:
+    """Breakdown with month as months-since-epoch and period as a code; cheap to merge"""
+    timeline = compile_tariff(definition)
+    local = timeline.local_times(df["timestamp"])
+    codes = timeline.period_codes(local, local=True)
+    imported = df["import_kwh"].to_numpy(dtype=np.float64)
+    exported = df["export_kwh"].to_numpy(dtype=np.float64)
+    frame = pd.DataFrame({
+        "site_id": df["site_id"].to_numpy(),
+        "month": local.astype("datetime64[M]").astype(np.int64),
+        "period": codes,
+        "import_kwh": imported,
+        "export_kwh": exported,
+        "energy_charge": imported * timeline.import_rates[codes],
+        "feed_in_credit": exported * timeline.export_rates[codes],
+    })
+    return frame.groupby(["site_id", "month", "period"], sort=False).sum().reset_index()
+
+
+def _merge(partials) -> Optional[pd.DataFrame]:
+    partials = [p for p in partials if p is not None and not p.empty]
+    if not partials:
+        return None
+    merged = pd.concat(partials, ignore_index=True)
+    return merged.groupby(["site_id", "month", "period"]).sum().reset_index()
+
+
+def _finish(partial: Optional[pd.DataFrame], definition: TariffDefinition) -> pd.DataFrame:
+    if partial is None or partial.empty:
+        return pd.DataFrame(columns=BREAKDOWN_COLUMNS)
+    periods = np.array(compile_tariff(definition).periods, dtype=object)
+    partial["month"] = partial["month"].to_numpy().astype("datetime64[M]").astype(str)
+    partial["period"] = periods[partial["period"].to_numpy()]
+    return partial[BREAKDOWN_COLUMNS]
+
+
+def bill_intervals(df: pd.DataFrame, definition: TariffDefinition = DEFAULT_TARIFF) -> pd.DataFrame:
+    """Price one frame of meter intervals.
+
+    `df` has one row per interval with site_id, timestamp, import_kwh and
+    export_kwh. Every interval is priced at the rate of the hour it starts
+    in. Returns one row per site, local calendar month ("YYYY-MM") and
+    tariff period.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=BREAKDOWN_COLUMNS)
+    return _finish(_partial_bill(df, definition), definition)
+
+
+def _bill_chunk(args):
+    df, definition = args
+    return _partial_bill(df, definition) if not df.empty else None
+
+
+def _chunks(source: Union[pd.DataFrame, Iterable[pd.DataFrame]], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunk_rows):
+            yield source.iloc[start:start + chunk_rows]
+    else:
+        yield from source
+
+
+def compute_bills(
+    source: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+    definition: TariffDefinition = DEFAULT_TARIFF,
+    chunk_rows: int = CHUNK_ROWS,
+    workers: Optional[int] = None
+) -> pd.DataFrame:
+    """Per-period breakdown for many sites, chunked and spread across cores.
+
+    `source` is a DataFrame or an iterable of DataFrames (e.g.
+    `read_meter_chunks`). Partial sums are additive, so chunks may split a
+    site or month anywhere. Chunks are handed out two per worker at a time
+    and each round is folded into the running totals, so memory stays
+    bounded by the chunk size and the number of site-months, not the input.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunks(source, chunk_rows)
+    totals = None
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        while True:
+            batch = [(chunk, definition) for chunk in islice(chunks, workers * 2)]
+            if not batch:
+                break
+            parts = pool.map(_bill_chunk, batch) if pool else map(_bill_chunk, batch)
+            totals = _merge([totals, *parts])
+    finally:
+        if pool:
+            pool.shutdown()
+    return _finish(totals, definition)
+
+
+def summarize_bills(breakdown: pd.DataFrame) -> pd.DataFrame:
+    """Collapse a breakdown to one bill per site and month"""
+    totals = breakdown.drop(columns="period").groupby(["site_id", "month"]).sum().reset_index()
+    totals["net_amount"] = totals["energy_charge"] - totals["feed_in_credit"]
+    money = ["energy_charge", "feed_in_credit", "net_amount"]
+    totals[money] = totals[money].round(2)
+    return totals
+
+
+def read_meter_chunks(path: str, chunk_rows: int = CHUNK_ROWS, site_ids=None) -> Iterator[pd.DataFrame]:
+    """Stream meter intervals from a Parquet file/directory in bounded chunks"""
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    predicate = ds.field("site_id").isin(site_ids) if site_ids else None
+    for batch in dataset.to_batches(columns=METER_COLUMNS, filter=predicate, batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+
+if __name__ == "__main__":
+    # python -m app.services.billing <meter parquet path> [output.csv]
+    bills = summarize_bills(compute_bills(read_meter_chunks(sys.argv[1])))
+    if len(sys.argv) > 2:
+        bills.to_csv(sys.argv[2], index=False)
+    else:
+        print(bills.to_string(index=False))
+# billing.py
@@ -0,0 +1,159 @@
+# broadcast_hub.py - Fan out messages to WebSocket clients through per-client queues
+from typing import Any, Dict, Optional, Set
+import asyncio
+import json
+import time
+from fastapi import WebSocket
+from ..core.config import WS_CLIENT_QUEUE_SIZE, WS_SEND_TIMEOUT, WS_MAX_OVERFLOWS
+from .db_executor import LatencyHistogram
+
+
+class ClientConnection:
+    """One connected client: its socket, bounded outbound queue and writer task"""
+
+    def __init__(self, ws: WebSocket, queue_size: int):
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+        self.connected_at = time.time()
+        self.degraded = False
+        self.overflows = 0
+        self.sent = 0
+        self.dropped = 0
+
+
+class BroadcastHub:
+    """Broadcasts JSON messages to many WebSocket clients without waiting on any of them.
+
+    `broadcast` serializes a message once and puts the text on every
+    client's queue with `put_nowait`; a writer task per client drains its
+    queue to the socket, each send bounded by `send_timeout`. A client
+    whose queue is full loses its oldest message. After `max_overflows`
+    overflows it is downgraded to essential messages only (alerts), and
+    after another `max_overflows` it is disconnected. Clients whose send
+    fails or times out are disconnected as well.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = WS_CLIENT_QUEUE_SIZE,
+        send_timeout: float = WS_SEND_TIMEOUT,
+        max_overflows: int = WS_MAX_OVERFLOWS
+    ):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.max_overflows = max_overflows
+        self.clients: Set[ClientConnection] = set()
+        self.send_latency = LatencyHistogram()
+        self._stats = {
+            "connected": 0,
+            "disconnected": 0,
+            "broadcasts": 0,
+            "enqueued": 0,
+            "dropped": 0,
+            "downgraded": 0,
+            "evicted": 0,
+        }
+
+    async def connect(self, ws: WebSocket) -> ClientConnection:
+        """Accept a socket and start its writer"""
+        await ws.accept()
+        client = ClientConnection(ws, self.queue_size)
+        client.task = asyncio.create_task(self._writer(client))
+        self.clients.add(client)
+        self._stats["connected"] += 1
+        return client
+
+    def disconnect(self, client: ClientConnection):
+        """Forget a client and stop its writer; safe to call more than once"""
+        if client not in self.clients:
+            return
+        self.clients.discard(client)
+        self._stats["disconnected"] += 1
+        if client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def _evict(self, client: ClientConnection, reason: str):
+        self.disconnect(client)
+        self._stats["evicted"] += 1
+        print(f"Evicting WebSocket client ({reason})")
+        asyncio.ensure_future(self._close(client.ws))
+
+    async def _close(self, ws: WebSocket):
+        try:
+            # 1013: try again later
+            await ws.close(code=1013)
+        except Exception:
+            pass
+
+    def send(self, client: ClientConnection, text: str) -> bool:
+        """Queue pre-serialized text for one client; returns False if something was dropped"""
+        try:
+            client.queue.put_nowait(text)
+            self._stats["enqueued"] += 1
+            return True
+        except asyncio.QueueFull:
+            pass
+        client.queue.get_nowait()
+        client.queue.put_nowait(text)
+        client.dropped += 1
+        client.overflows += 1
+        self._stats["dropped"] += 1
+        if client.overflows >= self.max_overflows:
+            if client.degraded:
+                self._evict(client, f"queue overflowed {client.dropped} times")
+            else:
+                client.degraded = True
+                client.overflows = 0
+                self._stats["downgraded"] += 1
+        return False
+
+    def broadcast(self, message: Dict[str, Any], essential: bool = True) -> int:
+        """Queue a message for every client; non-essential messages skip degraded clients.
+
+        Returns the number of clients it was queued for.
+        """
+        text = json.dumps(message, default=str)
+        self._stats["broadcasts"] += 1
+        queued = 0
+        for client in list(self.clients):
+            if client.degraded and not essential:
+                continue
+            self.send(client, text)
+            queued += 1
+        return queued
+
+    async def _writer(self, client: ClientConnection):
+        try:
+            while True:
+                text = await client.queue.get()
+                started = time.perf_counter()
+                try:
+                    await asyncio.wait_for(client.ws.send_text(text), self.send_timeout)
+                except asyncio.TimeoutError:
+                    self.send_latency.timeouts += 1
+                    self._evict(client, "send timed out")
+                    return
+                except Exception:
+                    self.send_latency.errors += 1
+                    self.disconnect(client)
+                    return
+                self.send_latency.observe((time.perf_counter() - started) * 1000)
+                client.sent += 1
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        depths = [client.queue.qsize() for client in self.clients]
+        return {
+            **self._stats,
+            "clients": len(self.clients),
+            "degraded_clients": sum(1 for client in self.clients if client.degraded),
+            "queue_capacity": self.queue_size,
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "send_latency": self.send_latency.to_dict(),
+        }
+
+# Create a singleton instance
+broadcast_hub = BroadcastHub()
@@ -0,0 +1,317 @@
+# command_dispatcher.py - Batched MQTT control commands with PUBACK / device ack tracking
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from collections import deque
+import asyncio
+import json
+import time
+import uuid
+import paho.mqtt.client as mqtt
+from ..core.config import (
+    MQTT_BROKER, COMMAND_QOS, COMMAND_ACK_TIMEOUT, COMMAND_RETRIES, COMMAND_DEVICE_ACK, COMMAND_MAX_INFLIGHT
+)
+
+# Control decisions as used by the optimizer: -1 charge, 1 discharge, anything else idle
+DECISION_ACTIONS = {-1: "charge", 0: "idle", 1: "discharge"}
+ACTION_DECISIONS = {action: decision for decision, action in DECISION_ACTIONS.items()}
+COMMAND_TOPIC = "devices/{}/control"
+# Devices confirm with {"command_id": ..., "status": "ok" | "<error>"}
+ACK_TOPIC = "devices/+/ack"
+# Publishes per loop turn; PUBACKs queue up behind each slice
+PUBLISH_SLICE = 1000
+# Broker used when MQTT_BROKER is unset, as in the MQTT agent and ingestion service
+DEFAULT_BROKER = "localhost"
+
+
+class Command:
+    """One device command and its delivery state"""
+
+    __slots__ = ("command_id", "device_id", "action", "topic", "payload", "batch",
+                 "mids", "attempts", "sent_at", "delivered_ms", "acked_ms", "status", "error")
+
+    def __init__(self, device_id: str, decision: int, batch: "_Batch", expires: float):
+        self.command_id = uuid.uuid4().hex
+        self.device_id = device_id
+        self.action = DECISION_ACTIONS.get(decision, "idle")
+        self.topic = COMMAND_TOPIC.format(device_id)
+        # Encoded once; retries resend the same bytes so devices can de-duplicate on command_id.
+        # Devices must ignore a command received after `expires` (epoch seconds): by then the
+        # dispatcher has reported it as timed out, and a later boundary may have superseded it
+        self.payload = json.dumps({
+            "command_id": self.command_id,
+            "device_id": device_id,
+            "action": self.action,
+            "ts": time.time(),
+            "expires": expires,
+        }).encode()
+        self.batch = batch
+        self.mids: List[int] = []
+        self.attempts = 0
+        self.sent_at = 0.0
+        self.delivered_ms: Optional[float] = None
+        self.acked_ms: Optional[float] = None
+        self.status = "pending"
+        self.error: Optional[str] = None
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "device_id": self.device_id,
+            "command_id": self.command_id,
+            "action": self.action,
+            "status": self.status,
+            "attempts": self.attempts,
+            "delivered_ms": self.delivered_ms,
+            "acked_ms": self.acked_ms,
+            "error": self.error,
+        }
+
+
+class _Batch:
+    def __init__(self, device_ack: bool):
+        self.device_ack = device_ack
+        self.remaining = 0
+        self.done = asyncio.Event()
+
+
+class CommandDispatcher:
+    """Sends control commands to many devices over one persistent MQTT connection.
+
+    `dispatch` takes (device_id, decision) pairs, encodes each payload once
+    and publishes the whole batch back to back at `qos` on a dedicated
+    client, yielding to the loop every `PUBLISH_SLICE` messages. A command
+    counts as delivered when the broker's PUBACK for it arrives; with
+    `device_ack` it is only complete once the device answers on
+    devices/<id>/ack with the same command_id. Commands still open after
+    `ack_timeout` are re-published, up to `retries` times, and reported as
+    timed out after that. Nothing is published while the broker connection
+    is down, so paho never queues commands that would go out long after
+    they were reported as timed out; payloads also carry an `expires`
+    deadline for anything paho re-sends after a reconnect. Paho callbacks only hand timestamps to the loop,
+    where all bookkeeping happens.
+    """
+
+    def __init__(
+        self,
+        broker: Optional[str] = MQTT_BROKER,
+        port: int = 1883,
+        qos: int = COMMAND_QOS,
+        ack_timeout: float = COMMAND_ACK_TIMEOUT,
+        retries: int = COMMAND_RETRIES,
+        device_ack: bool = COMMAND_DEVICE_ACK,
+        max_inflight: int = COMMAND_MAX_INFLIGHT,
+        latency_window: int = 4096
+    ):
+        self.broker = broker or DEFAULT_BROKER
+        self.port = port
+        self.qos = qos
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.device_ack = device_ack
+        self.max_inflight = max_inflight
+        self._client: Optional[mqtt.Client] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connected = False
+        self._connected_event: Optional[asyncio.Event] = None
+        self._by_mid: Dict[int, Command] = {}
+        self._by_id: Dict[str, Command] = {}
+        # Round-trip times (ms) of the most recent completed commands
+        self._latencies = deque(maxlen=latency_window)
+        self._stats = {
+            "batches": 0,
+            "commands": 0,
+            "published": 0,
+            "retries": 0,
+            "delivered": 0,
+            "acked": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "publish_errors": 0,
+            "not_connected": 0,
+        }
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Open the persistent connection; paho reconnects on its own after that"""
+        if self._client is not None:
+            return
+        self._loop = loop or asyncio.get_running_loop()
+        self._connected_event = asyncio.Event()
+        client = mqtt.Client(client_id=f"ems-dispatch-{uuid.uuid4().hex[:8]}")
+        # Paho's default of 20 in-flight messages serializes a batch on round trips, and any
+        # limit makes it rescan every queued message per PUBACK; 0 lifts the limit
+        client.max_inflight_messages_set(self.max_inflight)
+        # Unlimited, but only used while in flight: _publish does not publish while disconnected
+        client.max_queued_messages_set(0)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_publish = self._on_publish
+        client.on_message = self._on_message
+        client.connect_async(self.broker, self.port)
+        client.loop_start()
+        self._client = client
+
+    async def close(self):
+        if self._client is not None:
+            self._client.loop_stop()
+            self._client.disconnect()
+            self._client = None
+            self._connected = False
+
+    # Paho network thread: only timestamp and hand over to the loop
+
+    def _on_connect(self, client, userdata, flags, rc):
+        self._connected = rc == 0
+        if rc == 0:
+            client.subscribe(ACK_TOPIC, qos=1)
+            self._loop.call_soon_threadsafe(self._connected_event.set)
+        else:
+            print(f"Command dispatcher failed to connect, return code {rc}")
+
+    def _on_disconnect(self, client, userdata, rc):
+        self._connected = False
+        self._loop.call_soon_threadsafe(self._connected_event.clear)
+        if rc != 0:
+            print(f"Command dispatcher disconnected unexpectedly ({rc}); reconnecting")
+
+    def _on_publish(self, client, userdata, mid):
+        self._loop.call_soon_threadsafe(self._delivered, mid, time.perf_counter())
+
+    def _on_message(self, client, userdata, msg):
+        self._loop.call_soon_threadsafe(self._device_acked, msg.payload, time.perf_counter())
+
+    # Event loop
+
+    def _delivered(self, mid: int, at: float):
+        command = self._by_mid.pop(mid, None)
+        if command is None or command.status != "pending":
+            return
+        command.delivered_ms = (at - command.sent_at) * 1000
+        if not command.batch.device_ack:
+            self._finish(command, "delivered", command.delivered_ms)
+
+    def _device_acked(self, payload: bytes, at: float):
+        try:
+            ack = json.loads(payload)
+            command = self._by_id.get(ack["command_id"])
+        except (ValueError, TypeError, KeyError):
+            return
+        if command is None or command.status != "pending":
+            return
+        command.acked_ms = (at - command.sent_at) * 1000
+        status = ack.get("status", "ok")
+        if status == "ok":
+            self._finish(command, "acked", command.acked_ms)
+        else:
+            command.error = str(status)
+            self._finish(command, "rejected")
+
+    def _finish(self, command: Command, status: str, latency_ms: Optional[float] = None):
+        command.status = status
+        self._stats[status if status != "timeout" else "timeouts"] += 1
+        if latency_ms is not None:
+            self._latencies.append(latency_ms)
+        self._by_id.pop(command.command_id, None)
+        for mid in command.mids:
+            self._by_mid.pop(mid, None)
+        batch = command.batch
+        batch.remaining -= 1
+        if batch.remaining == 0:
+            batch.done.set()
+
+    async def _publish(self, commands: List[Command]):
+        """Publish commands back to back, registering each mid before PUBACKs can be handled"""
+        publish = self._client.publish
+        for start in range(0, len(commands), PUBLISH_SLICE):
+            for command in commands[start:start + PUBLISH_SLICE]:
+                if not self._connected:
+                    # Paho would queue it until reconnect; leave it to the next attempt instead
+                    command.error = "broker not connected"
+                    self._stats["not_connected"] += 1
+                    continue
+                command.attempts += 1
+                command.sent_at = time.perf_counter()
+                info = publish(command.topic, command.payload, qos=self.qos)
+                self._stats["published"] += 1
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    command.error = mqtt.error_string(info.rc)
+                    self._stats["publish_errors"] += 1
+                    continue
+                command.error = None
+                command.mids.append(info.mid)
+                self._by_mid[info.mid] = command
+            await asyncio.sleep(0)
+
+    async def dispatch(
+        self,
+        commands: Sequence[Tuple[str, int]],
+        device_ack: Optional[bool] = None,
+        ack_timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Send one command per (device_id, decision) and wait until each is confirmed or timed out"""
+        if self._client is None:
+            self.start()
+        started = time.perf_counter()
+        batch = _Batch(self.device_ack if device_ack is None else device_ack)
+        timeout = self.ack_timeout if ack_timeout is None else ack_timeout
+        expires = time.time() + timeout * (self.retries + 1)
+        batch_commands = [Command(device_id, decision, batch, expires) for device_id, decision in commands]
+        batch.remaining = len(batch_commands)
+        if not batch_commands:
+            batch.done.set()
+        for command in batch_commands:
+            self._by_id[command.command_id] = command
+        self._stats["batches"] += 1
+        self._stats["commands"] += len(batch_commands)
+
+        pending = batch_commands
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._stats["retries"] += len(pending)
+            if not self._connected:
+                try:
+                    await asyncio.wait_for(self._connected_event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            await self._publish(pending)
+            try:
+                await asyncio.wait_for(batch.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            pending = [command for command in pending if command.status == "pending"]
+            if not pending:
+                break
+        for command in pending:
+            self._finish(command, "timeout")
+
+        latencies = sorted(
+            command.acked_ms if batch.device_ack else command.delivered_ms
+            for command in batch_commands if command.status in ("delivered", "acked")
+        )
+        counts = {status: 0 for status in ("delivered", "acked", "rejected", "timeout")}
+        for command in batch_commands:
+            counts[command.status] += 1
+        return {
+            "commands": len(batch_commands),
+            **counts,
+            "success_rate": round((counts["delivered"] + counts["acked"]) / len(batch_commands), 4) if batch_commands else 1.0,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+            "latency_ms": {"p50": _pct(latencies, 0.5), "p95": _pct(latencies, 0.95), "max": _pct(latencies, 1.0)},
+            "results": [command.result() for command in batch_commands],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        return {
+            **self._stats,
+            "connected": self._connected,
+            "pending": len(self._by_id),
+            "awaiting_puback": len(self._by_mid),
+            "latency_ms": {"p50": _pct(latencies, 0.5), "p95": _pct(latencies, 0.95), "max": _pct(latencies, 1.0)},
+        }
+
+
+def _pct(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+# Create a singleton instance
+command_dispatcher = CommandDispatcher()
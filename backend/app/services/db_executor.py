@@ -0,0 +1,100 @@
+# db_executor.py - Run blocking Supabase client calls off the event loop
+from typing import Any, Callable, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import bisect
+import threading
+import time
+from ..core.config import SUPABASE_MAX_CONCURRENCY, SUPABASE_CALL_TIMEOUT
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram in milliseconds"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.errors = 0
+        self.timeouts = 0
+
+    def observe(self, elapsed_ms: float):
+        self.counts[bisect.bisect_left(self.buckets, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{b}" for b in self.buckets] + ["inf"]
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class SupabaseExecutor:
+    """Bounded thread pool for the synchronous supabase client.
+
+    At most `max_concurrency` calls run at once; further calls wait their
+    turn without blocking the event loop. Each call is bounded by `timeout`
+    seconds and its latency is recorded per (table, operation).
+    """
+
+    def __init__(self, max_concurrency: int = SUPABASE_MAX_CONCURRENCY, timeout: float = SUPABASE_CALL_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="supabase")
+        self._histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, table: str, operation: str) -> LatencyHistogram:
+        key = (table, operation)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = LatencyHistogram()
+            return self._histograms[key]
+
+    async def run(self, table: str, operation: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """Run `fn` in the pool and await its result.
+
+        On timeout the caller gets `asyncio.TimeoutError`; the worker thread
+        finishes the request in the background since it cannot be interrupted.
+        """
+        histogram = self._histogram(table, operation)
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._pool, fn),
+                self.timeout if timeout is None else timeout
+            )
+        except asyncio.TimeoutError:
+            histogram.timeouts += 1
+            raise
+        except Exception:
+            histogram.errors += 1
+            raise
+        finally:
+            histogram.observe((time.perf_counter() - started) * 1000)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return latency histograms keyed by "table.operation" """
+        with self._lock:
+            items = list(self._histograms.items())
+        return {
+            "max_concurrency": self.max_concurrency,
+            "timeout_s": self.timeout,
+            "operations": {f"{table}.{op}": h.to_dict() for (table, op), h in items},
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
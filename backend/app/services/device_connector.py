@@ -5,12 +5,24 @@ import paho.mqtt.client as mqtt
 import json
 from datetime import datetime
 from .supabase_service import supabase_service
+from .telemetry_writer import telemetry_writer
+from .device_presence import device_presence
+from .ingestion_bridge import MQTTIngestionBridge
+from .telemetry_buffer import telemetry_buffer
+from .telemetry_rollup import telemetry_rollup
+from .online_anomaly import online_anomaly_detector
+from .telemetry_stream import telemetry_stream
+from .modbus_poller import ModbusPoller
+from .command_dispatcher import command_dispatcher
+from ..core.config import MODBUS_BACKOFF_BASE, MODBUS_BACKOFF_MAX
 
 class DeviceConnector:
     def __init__(self):
         self.mqtt_client = None
         self.http_session = None
         self.devices: Dict[str, Dict[str, Any]] = {}
+        self.ingestion_bridge = MQTTIngestionBridge(self._handle_mqtt_message)
+        self.modbus_poller = ModbusPoller(self._handle_modbus_values)
         self._setup_mqtt()
         self._setup_http()
 
@@ -31,6 +43,8 @@ class DeviceConnector:
             self.mqtt_client.username_pw_set(username, password)
         
         try:
+            # Messages arrive on paho's thread; hand them to this loop's workers
+            self.ingestion_bridge.start(asyncio.get_running_loop())
             self.mqtt_client.connect(broker_url)
             self.mqtt_client.loop_start()
             return True
@@ -46,19 +60,22 @@ class DeviceConnector:
         client.subscribe("devices/+/control")
 
     def _on_mqtt_message(self, client, userdata, msg):
-        """Handle incoming MQTT messages"""
+        """Handle incoming MQTT messages (runs on paho's network thread)"""
+        self.ingestion_bridge.submit(msg.topic, msg.payload)
+
+    async def _handle_mqtt_message(self, topic: str, raw_payload: bytes):
+        """Parse and dispatch one MQTT message on the event loop"""
         try:
-            topic = msg.topic
-            payload = json.loads(msg.payload.decode())
+            payload = json.loads(raw_payload.decode())
             
             # Extract device ID from topic
             device_id = topic.split('/')[1]
             
             # Process telemetry data
             if 'telemetry' in topic:
-                asyncio.create_task(self._process_telemetry(device_id, payload))
+                await self._process_telemetry(device_id, payload)
             elif 'control' in topic:
-                asyncio.create_task(self._process_control(device_id, payload))
+                await self._process_control(device_id, payload)
                 
         except Exception as e:
             print(f"Error processing MQTT message: {e}")
@@ -70,18 +87,58 @@ class DeviceConnector:
             print("Unexpected disconnection. Attempting to reconnect...")
             client.reconnect()
 
-    async def _process_telemetry(self, device_id: str, data: Dict[str, Any]):
+    async def start_modbus_polling(self) -> int:
+        """Start polling every active Modbus device, retrying until the device list loads"""
+        delay = MODBUS_BACKOFF_BASE
+        while True:
+            try:
+                devices = await supabase_service.list_devices(limit=10000)
+                break
+            except Exception as e:
+                print(f"Error loading Modbus devices, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MODBUS_BACKOFF_MAX)
+        added = self.modbus_poller.load_devices(devices)
+        self.modbus_poller.start()
+        return added
+
+    async def _handle_modbus_values(self, device_id: str, values: Dict[str, Any]):
+        """Feed one polled register group into the same path as MQTT telemetry"""
+        await self._process_telemetry(device_id, values, source='modbus')
+
+    async def _process_telemetry(self, device_id: str, data: Dict[str, Any], source: str = 'mqtt'):
         """Process and store telemetry data"""
         try:
-            # Store telemetry in Supabase
-            await supabase_service.create_telemetry(device_id, data, source='mqtt')
-            
-            # Update device status
-            await supabase_service.update_device_status(device_id, 'online')
-            
+            # Persist first: the in-memory paths below must not be able to lose the message
+            await telemetry_writer.submit(device_id, data, source=source)
+
+            # Mark device online; persisted in bulk by the presence registry
+            device_presence.record(device_id, 'online')
         except Exception as e:
             print(f"Error processing telemetry: {e}")
 
+        try:
+            # Keep recent numeric values in memory for dashboard reads
+            telemetry_buffer.append(device_id, data)
+            telemetry_rollup.add(device_id, data)
+        except Exception as e:
+            print(f"Error buffering telemetry for {device_id}: {e}")
+
+        try:
+            # Score against each metric's running statistics
+            anomalies = online_anomaly_detector.observe(device_id, data)
+            if anomalies:
+                online_anomaly_detector.report(anomalies)
+        except Exception as e:
+            print(f"Error scoring telemetry for {device_id}: {e}")
+
+        try:
+            # Push to live WebSocket subscribers (coalesced, sent by the stream's flush task)
+            cached = supabase_service.device_cache.peek(device_id) or {}
+            telemetry_stream.publish(device_id, data, data.get('site_id') or cached.get('site_id'))
+        except Exception as e:
+            print(f"Error streaming telemetry for {device_id}: {e}")
+
     async def _process_control(self, device_id: str, data: Dict[str, Any]):
         """Process control commands"""
         try:
@@ -115,9 +172,17 @@ class DeviceConnector:
 
     async def close(self):
         """Cleanup connections"""
+        # Close the bridge first: with the "block" policy paho's thread may be
+        # waiting on this loop, and loop_stop() joins that thread
+        await self.ingestion_bridge.close()
         if self.mqtt_client:
             self.mqtt_client.loop_stop()
             self.mqtt_client.disconnect()
+        await self.modbus_poller.close()
+        await command_dispatcher.close()
+        await telemetry_writer.close()
+        await device_presence.close()
+        await telemetry_rollup.close()
         if self.http_session:
             await self.http_session.close()
 
@@ -0,0 +1,134 @@
+# device_presence.py - Coalesced device status / last_seen tracking
+from typing import Dict, Any, List, Optional
+import asyncio
+import time
+from datetime import datetime
+from .supabase_service import supabase_service
+from ..core.config import DEVICE_STATUS_FLUSH_INTERVAL, DEVICE_LAST_SEEN_GRANULARITY
+
+
+class DevicePresenceRegistry:
+    """Track device status and liveness in memory and persist them in bulk.
+
+    `record` is a cheap in-memory update. A background task periodically
+    updates only the devices whose status changed or whose stored last_seen
+    is older than `granularity` seconds. last_seen is written rounded down to
+    the flush interval so devices share a handful of UPDATE statements.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = DEVICE_STATUS_FLUSH_INTERVAL,
+        granularity: float = DEVICE_LAST_SEEN_GRANULARITY
+    ):
+        self.flush_interval = flush_interval
+        self.granularity = granularity
+        # device_id -> [status, last_seen, persisted_status, persisted_last_seen]
+        self._entries: Dict[str, List[Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "records": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "flush_errors": 0,
+        }
+
+    def start(self):
+        """Start the periodic flush task on the running event loop"""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def record(self, device_id: str, status: str = "online", seen_at: Optional[float] = None):
+        """Note that a device was seen with the given status"""
+        seen_at = seen_at if seen_at is not None else time.time()
+        entry = self._entries.get(device_id)
+        if entry is None:
+            self._entries[device_id] = [status, seen_at, None, 0.0]
+        else:
+            entry[0] = status
+            if seen_at > entry[1]:
+                entry[1] = seen_at
+        self._stats["records"] += 1
+        if self._task is None:
+            self.start()
+
+    def get(self, device_id: str) -> Optional[Dict[str, Any]]:
+        """Return the in-memory status and last_seen for a device"""
+        entry = self._entries.get(device_id)
+        if entry is None:
+            return None
+        return {
+            "status": entry[0],
+            "last_seen": datetime.utcfromtimestamp(entry[1]).isoformat()
+        }
+
+    def _pending(self) -> List[Dict[str, Any]]:
+        """Snapshot devices whose status changed or whose last_seen is stale"""
+        pending = []
+        for device_id, (status, last_seen, saved_status, saved_seen) in self._entries.items():
+            if status != saved_status or last_seen - saved_seen >= self.granularity:
+                pending.append({"id": device_id, "status": status, "last_seen": last_seen})
+        return pending
+
+    def _quantize(self, seen_at: float) -> float:
+        """Round a timestamp down to the flush interval"""
+        step = max(self.flush_interval, 1.0)
+        return seen_at - (seen_at % step)
+
+    async def flush(self) -> int:
+        """Write all pending status changes as grouped bulk updates"""
+        pending = self._pending()
+        if not pending:
+            return 0
+        rows = [
+            {
+                "id": row["id"],
+                "status": row["status"],
+                "last_seen": datetime.utcfromtimestamp(self._quantize(row["last_seen"])).isoformat()
+            }
+            for row in pending
+        ]
+        try:
+            await supabase_service.bulk_update_device_status(rows)
+        except Exception as e:
+            self._stats["flush_errors"] += 1
+            print(f"Error flushing device status for {len(rows)} devices: {e}")
+            return 0
+
+        for row in pending:
+            entry = self._entries.get(row["id"])
+            if entry is not None:
+                entry[2] = row["status"]
+                entry[3] = row["last_seen"]
+        self._stats["flushes"] += 1
+        self._stats["rows_written"] += len(rows)
+        return len(rows)
+
+    async def _run(self):
+        """Flush pending updates every `flush_interval` seconds"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        """Stop the flush task and persist any pending updates"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return registry counters"""
+        return {
+            **self._stats,
+            "tracked_devices": len(self._entries),
+            "pending": len(self._pending()),
+        }
+
+# Create a singleton instance
+device_presence = DevicePresenceRegistry()
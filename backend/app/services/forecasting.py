@@ -1,15 +1,171 @@
-# forecasting.py - ML-based forecasting for solar/load
-import random
-from datetime import datetime, timedelta
+# forecasting.py - Seasonal forecasting for solar/load from stored history
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from app.core.config import FORECAST_CACHE_SIZE, FORECAST_HISTORY_DAYS, FORECAST_SMOOTHING
+from app.services.history_store import read_history
+from app.services.ttl_cache import TTLCache
+
+# Fallbacks (kW) for hours with no history at all
+BASELINE = {"solar": 5.0, "load": 12.0}
+KIND_COLUMNS = {"solar": "pv_kw", "load": "load_kw"}
+DAY, WEEK = 24, 168
+HISTORY_HOURS = -(-FORECAST_HISTORY_DAYS // 7) * WEEK
+
+
+def _seasonal_profile(values: np.ndarray, period: int, alpha: float = FORECAST_SMOOTHING) -> np.ndarray:
+    """Exponentially weighted mean of each phase across seasons, per site.
+
+    `values` is (N, H) hourly data with NaN gaps, H a multiple of `period`;
+    the newest season gets weight alpha, the one before alpha*(1-alpha),
+    and so on. Phases never observed are NaN.
+    """
+    n_sites, hours = values.shape
+    seasons = values.reshape(n_sites, hours // period, period)
+    weights = alpha * (1 - alpha) ** np.arange(seasons.shape[1] - 1, -1, -1)
+    observed = ~np.isnan(seasons)
+    w = weights[None, :, None] * observed
+    total = (np.where(observed, seasons, 0.0) * w).sum(axis=1)
+    norm = w.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(norm > 0, total / norm, np.nan)
+
+
+def fit_models(site_ids: Sequence[str], issue_hour: datetime) -> Dict[str, Dict]:
+    """Fit solar (hour-of-day) and load (hour-of-week) profiles for many sites.
+
+    One columnar read covers all sites; the history is binned into an
+    (N sites, H hours) matrix and every profile is computed with array
+    operations. Load falls back from hour-of-week to hour-of-day to the
+    baseline as history gets sparser; solar from hour-of-day to baseline.
+    """
+    start = issue_hour - timedelta(hours=HISTORY_HOURS)
+    start_h = int(np.datetime64(start, "h").astype(np.int64))
+    df = read_history(
+        columns=["timestamp", "site_id", "pv_kw", "load_kw"],
+        start=start,
+        end=issue_hour,
+        site_ids=list(site_ids),
+        include_active=True
+    )
+    n_sites = len(site_ids)
+    index = {site_id: i for i, site_id in enumerate(site_ids)}
+    site = df["site_id"].map(index).to_numpy(dtype=np.int64) if len(df) else np.empty(0, dtype=np.int64)
+    hour = (
+        df["timestamp"].to_numpy(dtype="datetime64[h]").astype(np.int64) - start_h
+        if len(df) else np.empty(0, dtype=np.int64)
+    )
+    flat = site * HISTORY_HOURS + hour
+
+    hourly = {}
+    for kind, column in KIND_COLUMNS.items():
+        x = df[column].to_numpy(dtype=np.float64) if len(df) else np.empty(0)
+        ok = ~np.isnan(x)
+        sums = np.bincount(flat[ok], weights=x[ok], minlength=n_sites * HISTORY_HOURS)
+        counts = np.bincount(flat[ok], minlength=n_sites * HISTORY_HOURS)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            hourly[kind] = (sums / counts).reshape(n_sites, HISTORY_HOURS)
+
+    solar = _seasonal_profile(hourly["solar"], DAY)
+    solar = np.where(np.isnan(solar), BASELINE["solar"], solar)
+    load_day = _seasonal_profile(hourly["load"], DAY)
+    load = _seasonal_profile(hourly["load"], WEEK)
+    load = np.where(np.isnan(load), np.tile(load_day, WEEK // DAY), load)
+    load = np.where(np.isnan(load), BASELINE["load"], load)
+
+    return {
+        site_id: {"start_hour": start_h, "solar": solar[i], "load": load[i]}
+        for i, site_id in enumerate(site_ids)
+    }
+
+
+def _utc_hour(when: Optional[datetime] = None) -> datetime:
+    """Naive UTC hour containing `when` (default: now)"""
+    if when is None:
+        when = datetime.utcnow()
+    elif when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+class Forecaster:
+    """Per-site seasonal models and forecasts, cached per forecast hour.
+
+    Models are refit at most once per site per UTC hour (the forecast
+    hour), so all requests within that hour share one fit. Forecast
+    series are cached under (site, kind, forecast hour, horizon).
+    """
+
+    def __init__(self, maxsize: int = FORECAST_CACHE_SIZE):
+        self.models = TTLCache(maxsize=maxsize, ttl=3600)
+        self.results = TTLCache(maxsize=maxsize * 2, ttl=3600)
+
+    def _models(self, site_ids: Sequence[str], issue_hour: datetime) -> List[Dict]:
+        models = {site_id: self.models.get((site_id, issue_hour)) for site_id in site_ids}
+        missing = [site_id for site_id, model in models.items() if model is None]
+        if missing:
+            for site_id, model in fit_models(missing, issue_hour).items():
+                self.models.set((site_id, issue_hour), model)
+                models[site_id] = model
+        return [models[site_id] for site_id in site_ids]
+
+    def forecast_many(
+        self,
+        site_ids: Sequence[str],
+        hours: int,
+        kinds: Sequence[str] = ("solar", "load"),
+        start: Optional[datetime] = None
+    ) -> Dict:
+        """Forecasts for many sites sharing one hourly timestamp axis.
+
+        The axis begins at the UTC hour containing `start` (default: now).
+        Naive `start` values are taken to be UTC.
+        """
+        issue_hour = _utc_hour(start)
+        site_ids = list(dict.fromkeys(site_ids))
+        target = np.datetime64(issue_hour, "h").astype(np.int64) + np.arange(hours)
+        timestamps = [(issue_hour + timedelta(hours=i)).isoformat() for i in range(hours)]
+        result = {site_id: {} for site_id in site_ids}
+        if not site_ids or hours <= 0:
+            return {"timestamps": timestamps, "sites": result}
+
+        todo = {kind: [] for kind in kinds}
+        for kind in kinds:
+            for s in site_ids:
+                cached = self.results.get((s, kind, issue_hour, hours))
+                if cached is None:
+                    todo[kind].append(s)
+                else:
+                    result[s][kind] = cached
+        pending = sorted({s for sites in todo.values() for s in sites})
+        if pending:
+            models = dict(zip(pending, self._models(pending, issue_hour)))
+            for kind, sites in todo.items():
+                if not sites:
+                    continue
+                profiles = np.vstack([models[s][kind] for s in sites])
+                start_h = np.array([models[s]["start_hour"] for s in sites])
+                phase = (target[None, :] - start_h[:, None]) % profiles.shape[1]
+                values = np.round(np.take_along_axis(profiles, phase, axis=1), 2)
+                for s, row in zip(sites, values.tolist()):
+                    self.results.set((s, kind, issue_hour, hours), row)
+                    result[s][kind] = row
+        return {"timestamps": timestamps, "sites": result}
+
+    def forecast(self, site_id: str, hours: int, kind: str) -> List[Tuple[str, float]]:
+        batch = self.forecast_many([site_id], hours, (kind,))
+        return list(zip(batch["timestamps"], batch["sites"][site_id].get(kind, [])))
+
+    def stats(self):
+        return {"models": self.models.stats(), "results": self.results.stats()}
+
+# Create a singleton instance
+forecaster = Forecaster()
+
 
 def forecast_solar(site_id: str, hours: int):
-    base = 5  # kW average production
-    forecast = [round(base + random.uniform(-1, 2), 2) for _ in range(hours)]
-    timestamps = [(datetime.utcnow() + timedelta(hours=i)).isoformat() for i in range(hours)]
-    return list(zip(timestamps, forecast))
+    return forecaster.forecast(site_id, hours, "solar")
 
 def forecast_load(site_id: str, hours: int):
-    base = 12  # kW base load
-    forecast = [round(base + random.uniform(-2, 2), 2) for _ in range(hours)]
-    timestamps = [(datetime.utcnow() + timedelta(hours=i)).isoformat() for i in range(hours)]
-    return list(zip(timestamps, forecast))# forecasting.py
+    return forecaster.forecast(site_id, hours, "load")
+# forecasting.py
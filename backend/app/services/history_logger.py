@@ -1,12 +1,138 @@
 # history_logger.py - Persist optimization data for ML training
+import atexit
 import json
+import threading
 from pathlib import Path
 from datetime import datetime
+from typing import List, Optional
+from app.core.config import (
+    HISTORY_FLUSH_INTERVAL, HISTORY_MAX_BUFFERED_LINES, HISTORY_ROTATE_BYTES, HISTORY_ROTATE_DAILY
+)
 
 LOG_PATH = Path("app/data/optimization_history.jsonl")
 LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
 
+
+def history_segments(path: Path = LOG_PATH) -> List[Path]:
+    """All history files, oldest first: rotated segments, then the active file"""
+    segments = sorted(path.parent.glob(f"{path.stem}-*{path.suffix}"))
+    if path.exists():
+        segments.append(path)
+    return segments
+
+
+class HistoryWriter:
+    """Buffered JSONL appender with a background flush thread.
+
+    Lines are queued in memory and written by a daemon thread every
+    `flush_interval` seconds, or sooner once `max_buffered_lines` are
+    waiting. The file handle stays open between flushes. The active file
+    is rotated to `<stem>-<YYYYMMDD>-<seq><suffix>` when it would exceed
+    `rotate_bytes` or, with `rotate_daily`, when the UTC date changes.
+    Safe to call from multiple threads.
+    """
+
+    def __init__(
+        self,
+        path: Path = LOG_PATH,
+        flush_interval: float = HISTORY_FLUSH_INTERVAL,
+        max_buffered_lines: int = HISTORY_MAX_BUFFERED_LINES,
+        rotate_bytes: int = HISTORY_ROTATE_BYTES,
+        rotate_daily: bool = HISTORY_ROTATE_DAILY
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffered_lines = max_buffered_lines
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self._buffer: List[str] = []
+        self._lock = threading.Lock()      # guards _buffer
+        self._io_lock = threading.Lock()   # guards the file handle and rotation
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._size = 0
+        self._day: Optional[str] = None
+
+    def write(self, data: dict):
+        """Queue one record; it is serialized immediately"""
+        line = json.dumps(data)
+        with self._lock:
+            self._buffer.append(line)
+            pending = len(self._buffer)
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self._thread.start()
+        if pending >= self.max_buffered_lines:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing optimization history: {e}")
+
+    def flush(self):
+        """Write all queued lines to the active segment"""
+        with self._io_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+            if not lines:
+                return
+            chunk = "\n".join(lines) + "\n"
+            self._open_for(len(chunk.encode()))
+            self._file.write(chunk)
+            self._file.flush()
+            self._size += len(chunk.encode())
+
+    def _open_for(self, nbytes: int):
+        """Open the active file, rotating first if the write would cross a limit"""
+        today = datetime.utcnow().strftime("%Y%m%d")
+        if self._file is None:
+            if self.path.exists():
+                self._size = self.path.stat().st_size
+                self._day = datetime.utcfromtimestamp(self.path.stat().st_mtime).strftime("%Y%m%d")
+            else:
+                self._size = 0
+                self._day = today
+            self._file = self.path.open("a")
+        needs_rotation = self._size > 0 and (
+            (self.rotate_bytes and self._size + nbytes > self.rotate_bytes)
+            or (self.rotate_daily and self._day != today)
+        )
+        if needs_rotation:
+            self._rotate()
+            self._day = today
+
+    def _rotate(self):
+        self._file.close()
+        seq = len(list(self.path.parent.glob(f"{self.path.stem}-{self._day}-*{self.path.suffix}")))
+        self.path.rename(self.path.with_name(f"{self.path.stem}-{self._day}-{seq:04d}{self.path.suffix}"))
+        self._file = self.path.open("a")
+        self._size = 0
+
+    def close(self):
+        """Stop the flush thread and write out anything still queued"""
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        with self._io_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+history_writer = HistoryWriter()
+atexit.register(history_writer.close)
+
+
 def log_dispatch_result(data: dict):
     data["timestamp"] = datetime.utcnow().isoformat()
-    with LOG_PATH.open("a") as f:
-        f.write(json.dumps(data) + "\n")# history_logger.py
+    history_writer.write(data)
+# history_logger.py
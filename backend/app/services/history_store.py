@@ -0,0 +1,149 @@
+# history_store.py - Date/site partitioned Parquet store for optimization history
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from app.services.history_logger import LOG_PATH, history_segments
+
+STORE_PATH = Path("app/data/history")
+
+# Typed columns of a training record; `date` and `site_id` are partition keys
+SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("us")),
+    ("load_kw", pa.float64()),
+    ("pv_kw", pa.float64()),
+    ("tariff", pa.float64()),
+    ("soc", pa.float64()),
+    ("dispatch", pa.float64()),
+    ("date", pa.string()),
+    ("site_id", pa.string()),
+])
+PARTITIONING = ds.partitioning(
+    pa.schema([("date", pa.string()), ("site_id", pa.string())]), flavor="hive"
+)
+RECORD_COLUMNS = ["load_kw", "pv_kw", "tariff", "soc", "dispatch"]
+UNKNOWN_SITE = "unknown"
+# A fleet-wide backfill touches sites x days partitions in one write
+MAX_PARTITIONS = 1_000_000
+
+
+def _to_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Keep complete training records and coerce them to the store schema"""
+    if df.empty or not set(RECORD_COLUMNS).issubset(df.columns) or "timestamp" not in df.columns:
+        return pd.DataFrame(columns=SCHEMA.names)
+    df = df.dropna(subset=RECORD_COLUMNS + ["timestamp"])
+    out = pd.DataFrame({
+        "timestamp": pd.to_datetime(df["timestamp"], utc=True).dt.tz_localize(None).astype("datetime64[us]"),
+        **{col: pd.to_numeric(df[col], errors="coerce") for col in RECORD_COLUMNS},
+    })
+    site = df["site_id"] if "site_id" in df.columns else None
+    out["site_id"] = site.fillna(UNKNOWN_SITE).astype(str) if site is not None else UNKNOWN_SITE
+    out["date"] = out["timestamp"].dt.strftime("%Y-%m-%d")
+    return out.dropna(subset=RECORD_COLUMNS)[SCHEMA.names]
+
+
+def write_history(df: pd.DataFrame, root: Path = STORE_PATH) -> int:
+    """Append training records to the store, one file per date/site partition"""
+    frame = _to_frame(df)
+    if frame.empty:
+        return 0
+    table = pa.Table.from_pandas(frame, schema=SCHEMA, preserve_index=False)
+    pq.write_to_dataset(
+        table,
+        root_path=str(root),
+        partitioning=PARTITIONING,
+        basename_template=f"part-{datetime.utcnow():%Y%m%d%H%M%S%f}-{{i}}.parquet",
+        max_partitions=MAX_PARTITIONS,
+    )
+    return len(frame)
+
+
+def convert_jsonl_history(
+    paths: Optional[Iterable[Path]] = None,
+    root: Path = STORE_PATH,
+    chunk_lines: int = 200_000,
+    remove: bool = False
+) -> int:
+    """One-shot conversion of JSONL history segments into the store.
+
+    Only complete training records (all of load_kw, pv_kw, tariff, soc,
+    dispatch and a timestamp) are kept. Files are read in chunks of
+    `chunk_lines` lines so memory stays bounded. With `remove`, each file
+    is deleted once converted. Returns the number of records written.
+    """
+    paths = history_segments() if paths is None else list(paths)
+    written = 0
+    for path in paths:
+        with pd.read_json(path, lines=True, chunksize=chunk_lines, convert_dates=False) as reader:
+            for chunk in reader:
+                written += write_history(chunk, root)
+        if remove:
+            path.unlink()
+    return written
+
+
+def sync_history_store(root: Path = STORE_PATH) -> int:
+    """Move rotated (closed) JSONL segments into the store.
+
+    The active file is left alone; `read_history(include_active=True)`
+    reads it directly.
+    """
+    rotated = [path for path in history_segments() if path != LOG_PATH]
+    return convert_jsonl_history(rotated, root, remove=True)
+
+
+def read_history(
+    columns: Optional[List[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    site_ids: Optional[List[str]] = None,
+    root: Path = STORE_PATH,
+    include_active: bool = False
+) -> pd.DataFrame:
+    """Load history as a DataFrame, reading only the requested columns and range.
+
+    `start`/`end` (naive UTC, end exclusive) prune date partitions before
+    any file is opened and then filter on timestamp inside the files.
+    `include_active` also parses the not-yet-rotated JSONL file.
+    """
+    columns = list(columns) if columns else [c for c in SCHEMA.names if c != "date"]
+    frames = []
+    if root.exists() and any(root.iterdir()):
+        dataset = ds.dataset(str(root), format="parquet", schema=SCHEMA, partitioning=PARTITIONING)
+        predicate = None
+
+        def _and(expr):
+            return expr if predicate is None else predicate & expr
+
+        if start is not None:
+            predicate = _and((ds.field("date") >= f"{start:%Y-%m-%d}") & (ds.field("timestamp") >= pa.scalar(start, pa.timestamp("us"))))
+        if end is not None:
+            predicate = _and((ds.field("date") <= f"{end:%Y-%m-%d}") & (ds.field("timestamp") < pa.scalar(end, pa.timestamp("us"))))
+        if site_ids:
+            predicate = _and(ds.field("site_id").isin(site_ids))
+        frames.append(dataset.to_table(columns=columns, filter=predicate).to_pandas())
+
+    if include_active and LOG_PATH.exists() and LOG_PATH.stat().st_size:
+        active = _to_frame(pd.read_json(LOG_PATH, lines=True, convert_dates=False))
+        if start is not None:
+            active = active[active["timestamp"] >= start]
+        if end is not None:
+            active = active[active["timestamp"] < end]
+        if site_ids:
+            active = active[active["site_id"].isin(site_ids)]
+        frames.append(active[columns])
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    # One-shot migration of all JSONL history; run while the API is stopped
+    # python -m app.services.history_store
+    print(f"Converted {convert_jsonl_history(remove=True)} records into {STORE_PATH}")
+# history_store.py
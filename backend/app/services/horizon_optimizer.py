@@ -0,0 +1,340 @@
+# horizon_optimizer.py - Cost-minimizing 24h battery schedule over quarter-hour slots
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from app.core.constants import DEFAULT_BATTERY_CAPACITY
+from app.services.battery_lifecycle import estimate_battery_soh, calculate_degradation_penalty
+from app.services.forecasting import forecaster
+from app.services.tariff_engine import TARIFF_RATES, tariff_rates
+
+SLOT_MINUTES = 15
+HORIZON_SLOTS = 96
+SLOT_HOURS = SLOT_MINUTES / 60
+# Number of SoC grid points between soc_min and soc_max
+SOC_LEVELS = 51
+# Battery wear cost per kWh of throughput for a healthy battery (ILS)
+BASE_WEAR_COST = 0.05
+# Below this many sites a process pool costs more than it saves
+MIN_SITES_PER_WORKER = 250
+
+
+@dataclass
+class SiteBatteryState:
+    site_id: str
+    soc: float                                  # %
+    capacity_kwh: float = DEFAULT_BATTERY_CAPACITY
+    max_charge_kw: float = 50.0
+    max_discharge_kw: float = 50.0
+    soc_min: float = 10.0                       # %
+    soc_max: float = 95.0                       # %
+    round_trip_efficiency: float = 0.9
+    cycles: int = 0
+    depth_of_discharge: float = 0.8
+    temperature: float = 25.0
+    pv_kw: Optional[List[float]] = None         # HORIZON_SLOTS values, forecast if None
+    load_kw: Optional[List[float]] = None       # HORIZON_SLOTS values, forecast if None
+    import_price: Optional[List[float]] = None  # HORIZON_SLOTS values, tariff_engine if None
+    export_price: float = TARIFF_RATES["feed_in"]
+
+
+def slot_start(now: Optional[datetime] = None) -> datetime:
+    """Start of the quarter-hour slot containing `now`, as an aware UTC datetime.
+
+    Naive values are taken to be UTC, like the stored telemetry history the
+    forecasts are fitted on; the tariff lookup converts to its own timezone.
+    """
+    if now is None:
+        now = datetime.now(timezone.utc)
+    elif now.tzinfo is None:
+        now = now.replace(tzinfo=timezone.utc)
+    else:
+        now = now.astimezone(timezone.utc)
+    return now.replace(minute=now.minute - now.minute % SLOT_MINUTES, second=0, microsecond=0)
+
+
+def tariff_curve(start: datetime, slots: int = HORIZON_SLOTS) -> np.ndarray:
+    """Import price per slot from the ToU tariff"""
+    return tariff_rates(pd.date_range(start, periods=slots, freq=f"{SLOT_MINUTES}min"))
+
+
+def _hourly_to_slots(hourly: List[float], start: datetime, slots: int = HORIZON_SLOTS) -> np.ndarray:
+    """Expand hourly values beginning at start's hour onto slots beginning at `start`"""
+    offset = start.minute // SLOT_MINUTES
+    values = np.asarray(hourly, dtype=np.float64)
+    return np.repeat(values, 60 // SLOT_MINUTES)[offset:offset + slots]
+
+
+def solve_batch(
+    soc0: np.ndarray,
+    capacity_kwh: np.ndarray,
+    max_charge_kw: np.ndarray,
+    max_discharge_kw: np.ndarray,
+    soc_min: np.ndarray,
+    soc_max: np.ndarray,
+    efficiency: np.ndarray,
+    wear_cost: np.ndarray,
+    net_load_kw: np.ndarray,
+    import_price: np.ndarray,
+    export_price: np.ndarray,
+    levels: int = SOC_LEVELS,
+    dt: float = SLOT_HOURS
+) -> Dict[str, np.ndarray]:
+    """Solve the dispatch problem for N sites at once by dynamic programming.
+
+    SoC is discretized into `levels` points between soc_min and soc_max
+    per site; the DP is exact on that grid. Per-site arrays have shape (N,)
+    and per-slot arrays (N, T). Charging/discharging losses use
+    sqrt(round-trip efficiency) each way, grid import is priced at
+    `import_price`, export earns `export_price`, and every kWh of battery
+    throughput costs `wear_cost`. Stored energy left at the end is valued
+    at the cheapest import price so the schedule does not dump the battery.
+
+    Returns battery power (kW, + charging), grid power, SoC trajectory (%)
+    and total cost per site.
+    """
+    n_sites, slots = net_load_kw.shape
+    eta = np.sqrt(efficiency)
+    step_pct = (soc_max - soc_min) / (levels - 1)
+    step_kwh = step_pct * capacity_kwh / 100
+
+    # Largest level jump per slot each way allowed by the power limits
+    up = np.floor(max_charge_kw * dt * eta / step_kwh + 1e-9).astype(int)
+    down = np.floor(max_discharge_kw * dt / eta / step_kwh + 1e-9).astype(int)
+    deltas = np.arange(-min(down.max(), levels - 1), min(up.max(), levels - 1) + 1)
+
+    # Battery AC power for each delta (N, D): charging draws e/eta, discharging delivers e*eta
+    energy = deltas[None, :] * step_kwh[:, None]
+    power = np.where(energy > 0, energy / eta[:, None], energy * eta[:, None]) / dt
+    feasible = (deltas[None, :] <= up[:, None]) & (-deltas[None, :] <= down[:, None])
+    wear = wear_cost[:, None] * np.abs(power) * dt
+
+    export_price = np.broadcast_to(export_price, (n_sites, slots))
+    import_price = np.broadcast_to(import_price, (n_sites, slots))
+
+    # Terminal value: energy above soc_min, valued at the cheapest import price after discharge losses
+    stored = np.arange(levels)[None, :] * step_kwh[:, None]
+    value = -stored * eta[:, None] * import_price.min(axis=1)[:, None]
+
+    policy = np.zeros((slots, n_sites, levels), dtype=np.int16)
+    for t in range(slots - 1, -1, -1):
+        grid = net_load_kw[:, t:t + 1] + power
+        cost = (
+            import_price[:, t:t + 1] * np.maximum(grid, 0) * dt
+            - export_price[:, t:t + 1] * np.maximum(-grid, 0) * dt
+            + wear
+        )
+        cost = np.where(feasible, cost, np.inf)
+        best = np.full((n_sites, levels), np.inf)
+        best_delta = np.zeros((n_sites, levels), dtype=np.int16)
+        for k, d in enumerate(deltas):
+            lo, hi = max(0, -d), min(levels, levels - d)
+            candidate = cost[:, k:k + 1] + value[:, lo + d:hi + d]
+            window = best[:, lo:hi]
+            better = candidate < window
+            window[better] = candidate[better]
+            best_delta[:, lo:hi][better] = d
+        value = best
+        policy[t] = best_delta
+
+    # Forward pass from the grid point nearest each site's current SoC
+    rows = np.arange(n_sites)
+    level = np.clip(np.rint((soc0 - soc_min) / step_pct), 0, levels - 1).astype(int)
+    soc_path = np.empty((n_sites, slots + 1))
+    soc_path[:, 0] = soc_min + level * step_pct
+    battery_kw = np.empty((n_sites, slots))
+    for t in range(slots):
+        d = policy[t, rows, level]
+        battery_kw[:, t] = power[rows, d - deltas[0]]
+        level = level + d
+        soc_path[:, t + 1] = soc_min + level * step_pct
+
+    grid_kw = net_load_kw + battery_kw
+    total = (
+        import_price * np.maximum(grid_kw, 0) * dt
+        - export_price * np.maximum(-grid_kw, 0) * dt
+        + wear_cost[:, None] * np.abs(battery_kw) * dt
+    ).sum(axis=1)
+    return {"battery_kw": battery_kw, "grid_kw": grid_kw, "soc": soc_path, "cost": total}
+
+
+def _solve_chunk(args):
+    return solve_batch(**args)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Shared solver pool, created on first use and kept for the life of the process.
+
+    Workers are spawned rather than forked: the API process runs threads
+    (executors, MQTT loops) that a fork would copy mid-flight.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool():
+    """Drop a pool whose workers died so the next call starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _inputs_key(arrays) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for arr in arrays:
+        digest.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+class HorizonOptimizer:
+    """Plans 24h battery schedules for many sites and remembers the last plan.
+
+    A site whose slot, inputs and parameters are unchanged since its last
+    solve, and whose SoC is still within one grid step of the planned start,
+    gets its previous solution back without re-solving. This is the common
+    case when re-planning every few minutes inside a 15-minute slot. It is
+    plan reuse only: any other site is solved from scratch. The remaining
+    sites are solved together, split across the shared process pool when
+    there are enough of them.
+    """
+
+    def __init__(self, workers: Optional[int] = None, levels: int = SOC_LEVELS):
+        self.workers = workers or os.cpu_count() or 1
+        self.levels = levels
+        self._plans: Dict[str, Dict] = {}
+        self.stats = {"solved": 0, "reused": 0}
+
+    def _prepare(self, sites: List[SiteBatteryState], start: datetime) -> Dict[str, np.ndarray]:
+        tariff = None
+        # One extra hour covers a start part-way through the hour
+        hours = HORIZON_SLOTS * SLOT_MINUTES // 60 + 1
+        missing = [s.site_id for s in sites if s.pv_kw is None or s.load_kw is None]
+        forecasts = forecaster.forecast_many(missing, hours, ("solar", "load"), start=start)["sites"] if missing else {}
+        net, price = [], []
+        for site in sites:
+            if site.soc_max <= site.soc_min:
+                raise ValueError(f"Site {site.site_id}: soc_max must be greater than soc_min")
+            if site.pv_kw is not None:
+                pv = np.asarray(site.pv_kw, dtype=np.float64)
+            else:
+                pv = _hourly_to_slots(forecasts[site.site_id]["solar"], start)
+            if site.load_kw is not None:
+                load = np.asarray(site.load_kw, dtype=np.float64)
+            else:
+                load = _hourly_to_slots(forecasts[site.site_id]["load"], start)
+            if pv.shape != (HORIZON_SLOTS,) or load.shape != (HORIZON_SLOTS,):
+                raise ValueError(f"Site {site.site_id}: pv_kw and load_kw need {HORIZON_SLOTS} values")
+            net.append(load - pv)
+            if site.import_price is not None:
+                price.append(np.asarray(site.import_price, dtype=np.float64))
+            else:
+                if tariff is None:
+                    tariff = tariff_curve(start)
+                price.append(tariff)
+
+        penalty = np.array([
+            calculate_degradation_penalty(estimate_battery_soh(s.cycles, s.depth_of_discharge, s.temperature))
+            for s in sites
+        ])
+        return {
+            "soc0": np.array([s.soc for s in sites], dtype=np.float64),
+            "capacity_kwh": np.array([s.capacity_kwh for s in sites], dtype=np.float64),
+            "max_charge_kw": np.array([s.max_charge_kw for s in sites], dtype=np.float64),
+            "max_discharge_kw": np.array([s.max_discharge_kw for s in sites], dtype=np.float64),
+            "soc_min": np.array([s.soc_min for s in sites], dtype=np.float64),
+            "soc_max": np.array([s.soc_max for s in sites], dtype=np.float64),
+            "efficiency": np.array([s.round_trip_efficiency for s in sites], dtype=np.float64),
+            # A worn battery (lower penalty multiplier) makes cycling more expensive
+            "wear_cost": BASE_WEAR_COST / penalty,
+            "net_load_kw": np.vstack(net),
+            "import_price": np.vstack(price),
+            "export_price": np.array([[s.export_price] for s in sites], dtype=np.float64),
+        }
+
+    def solve(self, sites: List[SiteBatteryState], start: Optional[datetime] = None, parallel: bool = True) -> List[Dict]:
+        """Return one schedule per site, in input order"""
+        if not sites:
+            return []
+        start = slot_start(start)
+        inputs = self._prepare(sites, start)
+        param_names = [k for k in inputs if k != "soc0"]
+        keys = [
+            _inputs_key([inputs[name][i] for name in param_names]) for i in range(len(sites))
+        ]
+
+        results: List[Optional[Dict]] = [None] * len(sites)
+        todo = []
+        for i, site in enumerate(sites):
+            plan = self._plans.get(site.site_id)
+            step = (inputs["soc_max"][i] - inputs["soc_min"][i]) / (self.levels - 1)
+            if (
+                plan is not None and plan["start"] == start and plan["key"] == keys[i]
+                and abs(plan["schedule"]["soc"][0] - inputs["soc0"][i]) <= step
+            ):
+                results[i] = plan["schedule"]
+                self.stats["reused"] += 1
+            else:
+                todo.append(i)
+
+        if todo:
+            idx = np.array(todo)
+            chunk_inputs = {name: arr[idx] for name, arr in inputs.items()}
+            solved = self._solve_indices(chunk_inputs, parallel)
+            for j, i in enumerate(todo):
+                schedule = {name: solved[name][j] for name in solved}
+                self._plans[sites[i].site_id] = {"start": start, "key": keys[i], "schedule": schedule}
+                results[i] = schedule
+            self.stats["solved"] += len(todo)
+
+        slot_times = [(start + timedelta(minutes=SLOT_MINUTES * t)).isoformat() for t in range(HORIZON_SLOTS)]
+        return [_to_response(site.site_id, slot_times, schedule) for site, schedule in zip(sites, results)]
+
+    def _solve_indices(self, inputs: Dict[str, np.ndarray], parallel: bool) -> Dict[str, np.ndarray]:
+        n = len(inputs["soc0"])
+        workers = min(self.workers, n // MIN_SITES_PER_WORKER) if parallel else 1
+        if workers <= 1:
+            return solve_batch(levels=self.levels, **inputs)
+        bounds = np.linspace(0, n, workers + 1).astype(int)
+        chunks = [
+            {**{name: arr[a:b] for name, arr in inputs.items()}, "levels": self.levels}
+            for a, b in zip(bounds[:-1], bounds[1:])
+        ]
+        try:
+            parts = list(_get_pool(self.workers).map(_solve_chunk, chunks))
+        except BrokenProcessPool:
+            _reset_pool()
+            raise
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def _to_response(site_id: str, slot_times: List[str], schedule: Dict[str, np.ndarray]) -> Dict:
+    battery_kw = schedule["battery_kw"]
+    return {
+        "site_id": site_id,
+        "slots": slot_times,
+        # Same convention as optimize_dispatch: -1 = charge, 0 = idle, 1 = discharge
+        "dispatch": np.where(battery_kw > 1e-6, -1, np.where(battery_kw < -1e-6, 1, 0)).tolist(),
+        "battery_kw": np.round(battery_kw, 3).tolist(),
+        "grid_kw": np.round(schedule["grid_kw"], 3).tolist(),
+        "soc": np.round(schedule["soc"], 2).tolist(),
+        "cost": round(float(schedule["cost"]), 2),
+    }
+
+# Create a singleton instance
+horizon_optimizer = HorizonOptimizer()
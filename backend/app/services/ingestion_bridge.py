@@ -0,0 +1,170 @@
+# ingestion_bridge.py - Hand MQTT messages from paho's thread to asyncio workers
+from typing import Any, Awaitable, Callable, Dict, Optional
+from collections import deque
+import asyncio
+import concurrent.futures
+import time
+from ..core.config import INGEST_QUEUE_SIZE, INGEST_WORKERS, INGEST_OVERFLOW_POLICY, INGEST_BLOCK_TIMEOUT
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+
+class MQTTIngestionBridge:
+    """Thread-safe bridge from the paho network thread into the event loop.
+
+    `submit` is called on paho's thread and hands the raw message to the
+    application loop with `call_soon_threadsafe`. A pool of `workers`
+    coroutines takes messages from a bounded queue and awaits `handler`.
+    When the queue is full the `overflow_policy` decides what happens:
+    "block" holds the paho thread until there is room (at most
+    `block_timeout` seconds, after which the message is dropped),
+    "drop_oldest" discards the oldest queued message and "drop_newest"
+    discards the incoming one. `close` releases any producer still blocked,
+    so paho's thread can always be joined after the bridge is closed.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str, bytes], Awaitable[Any]],
+        queue_size: int = INGEST_QUEUE_SIZE,
+        workers: int = INGEST_WORKERS,
+        overflow_policy: str = INGEST_OVERFLOW_POLICY,
+        block_timeout: float = INGEST_BLOCK_TIMEOUT,
+        latency_window: int = 2048
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow_policy!r}, expected one of {OVERFLOW_POLICIES}")
+        self.handler = handler
+        self.queue_size = queue_size
+        self.workers = workers
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self._closing = False
+        # _put_blocking tasks currently waiting for room on the queue
+        self._blocked = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        # (queue wait, processing time) in seconds for the most recent messages
+        self._latencies = deque(maxlen=latency_window)
+        self._stats = {
+            "received": 0,
+            "processed": 0,
+            "failed": 0,
+            "dropped_oldest": 0,
+            "dropped_newest": 0,
+            "dropped_not_running": 0,
+            "dropped_block_timeout": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Bind to the application loop and start the worker pool"""
+        if self.running:
+            return
+        self._loop = loop or asyncio.get_running_loop()
+        self._closing = False
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [self._loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, topic: str, payload: bytes):
+        """Hand one message to the event loop; call from the paho thread"""
+        loop = self._loop
+        if loop is None or loop.is_closed() or self._closing:
+            self._stats["dropped_not_running"] += 1
+            return
+        item = (topic, payload, time.perf_counter())
+        if self.overflow_policy == "block":
+            future = asyncio.run_coroutine_threadsafe(self._put_blocking(item), loop)
+            try:
+                future.result(self.block_timeout)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                self._stats["dropped_block_timeout"] += 1
+            except concurrent.futures.CancelledError:
+                # Released by close()
+                self._stats["dropped_not_running"] += 1
+        else:
+            loop.call_soon_threadsafe(self._enqueue, item)
+
+    async def _put_blocking(self, item):
+        """Wait for room on the queue; backs up the paho thread while full"""
+        if self._closing:
+            raise asyncio.CancelledError()
+        self._stats["received"] += 1
+        task = asyncio.current_task()
+        self._blocked.add(task)
+        try:
+            await self._queue.put(item)
+        finally:
+            self._blocked.discard(task)
+
+    def _enqueue(self, item):
+        """Put a message on the queue applying the overflow policy; runs on the loop"""
+        self._stats["received"] += 1
+        if self._queue.full():
+            if self.overflow_policy == "drop_newest":
+                self._stats["dropped_newest"] += 1
+                return
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self._stats["dropped_oldest"] += 1
+        self._queue.put_nowait(item)
+
+    async def _worker(self):
+        """Take messages off the queue and run the handler"""
+        while True:
+            topic, payload, enqueued_at = await self._queue.get()
+            started = time.perf_counter()
+            try:
+                await self.handler(topic, payload)
+                self._stats["processed"] += 1
+            except Exception as e:
+                self._stats["failed"] += 1
+                print(f"Error handling MQTT message on {topic}: {e}")
+            finally:
+                finished = time.perf_counter()
+                self._latencies.append((started - enqueued_at, finished - started))
+                self._queue.task_done()
+
+    async def close(self, drain_timeout: float = 5.0):
+        """Wait for queued messages to be handled, then stop the workers"""
+        if not self.running:
+            return
+        # Refuse new messages and release paho's thread if it is blocked on a full queue
+        self._closing = True
+        for task in list(self._blocked):
+            task.cancel()
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"Ingestion bridge closed with {self._queue.qsize()} messages still queued")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, drop counts and latency percentiles in ms"""
+        samples = list(self._latencies)
+        waits = sorted(s[0] for s in samples)
+        runs = sorted(s[1] for s in samples)
+
+        def pct(values, q):
+            if not values:
+                return 0.0
+            return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 3)
+
+        return {
+            **self._stats,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_capacity": self.queue_size,
+            "workers": self.workers,
+            "overflow_policy": self.overflow_policy,
+            "queue_wait_ms": {"p50": pct(waits, 0.5), "p95": pct(waits, 0.95), "max": pct(waits, 1.0)},
+            "processing_ms": {"p50": pct(runs, 0.5), "p95": pct(runs, 0.95), "max": pct(runs, 1.0)},
+        }
@@ -0,0 +1,304 @@
+# modbus_poller.py - Poll Modbus RTU buses and TCP gateways on per-group schedules
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from collections import deque
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from pymodbus.client import AsyncModbusSerialClient, AsyncModbusTcpClient
+from pymodbus.exceptions import ModbusException
+from ..agents.register_map import ReadBlock, RegisterMap, decode_blocks, load_register_map
+from ..core.config import (
+    MODBUS_TIMEOUT, MODBUS_DEFAULT_INTERVAL, MODBUS_GATEWAY_CONCURRENCY,
+    MODBUS_BACKOFF_AFTER, MODBUS_BACKOFF_BASE, MODBUS_BACKOFF_MAX, MODBUS_REGISTER_MAPS
+)
+
+TelemetrySink = Callable[[str, Dict[str, Any]], Awaitable[Any]]
+
+
+class PolledDevice:
+    """One slave on a bus: its planned reads per group and failure state"""
+
+    def __init__(self, device_id: str, unit: int, register_map: RegisterMap, intervals: Optional[Dict[str, float]] = None):
+        self.device_id = device_id
+        self.unit = unit
+        self.register_map = register_map
+        intervals = intervals or {}
+        # group -> (interval seconds, block reads)
+        self.groups: Dict[str, Tuple[float, List[ReadBlock]]] = {
+            name: (intervals.get(name) or register_map.groups.get(name) or MODBUS_DEFAULT_INTERVAL, blocks)
+            for name, blocks in register_map.plan_groups().items()
+        }
+        self.failures = 0
+        self.backoff_until = 0.0
+        self.last_poll: Optional[float] = None
+
+
+class ModbusBus:
+    """One serial line or TCP gateway: a single client shared by the devices behind it"""
+
+    def __init__(self, key: str, client: Any, concurrency: int):
+        self.key = key
+        self.client = client
+        self.concurrency = concurrency
+        self.devices: Dict[str, PolledDevice] = {}
+        # (due, seq, device, group), monotonic time
+        self.heap: List[Tuple[float, int, PolledDevice, str]] = []
+        self.wake = asyncio.Event()
+        self.connect_lock = asyncio.Lock()
+        self.tasks: List[asyncio.Task] = []
+        # Start lag (due -> started) and duration of recent group polls, in ms
+        self.lag_ms = deque(maxlen=1024)
+        self.poll_ms = deque(maxlen=1024)
+        self.stats = {"polls": 0, "failed_polls": 0, "requests": 0, "timeouts": 0, "errors": 0, "skipped_backoff": 0}
+
+
+class ModbusPoller:
+    """Polls a fleet of Modbus devices and feeds the values into telemetry ingestion.
+
+    Devices are grouped by bus: every serial port is one bus worked by a
+    single task, so requests on a line never overlap, while each TCP
+    gateway gets its own connection and `gateway_concurrency` workers, so
+    gateways are polled in parallel. Each register group of a device is
+    its own job on the bus's due-time heap and repeats on the group's
+    interval, keeping to its grid and skipping cycles it fell behind on.
+    A poll stops at the first timed-out block; after `backoff_after`
+    consecutive failed polls a device is left alone for `backoff_base`
+    seconds, doubling per further failure up to `backoff_max`.
+    """
+
+    def __init__(
+        self,
+        sink: Optional[TelemetrySink] = None,
+        timeout: float = MODBUS_TIMEOUT,
+        gateway_concurrency: int = MODBUS_GATEWAY_CONCURRENCY,
+        backoff_after: int = MODBUS_BACKOFF_AFTER,
+        backoff_base: float = MODBUS_BACKOFF_BASE,
+        backoff_max: float = MODBUS_BACKOFF_MAX
+    ):
+        self.sink = sink
+        self.timeout = timeout
+        self.gateway_concurrency = gateway_concurrency
+        self.backoff_after = backoff_after
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.buses: Dict[str, ModbusBus] = {}
+        self._device_bus: Dict[str, ModbusBus] = {}
+        self._seq = itertools.count()
+        self._running = False
+        self._stats = {"devices_added": 0, "backoffs": 0, "values": 0}
+
+    def add_device(
+        self,
+        device_id: str,
+        register_map: Union[RegisterMap, str],
+        unit: int = 1,
+        host: Optional[str] = None,
+        port: int = 502,
+        serial_port: Optional[str] = None,
+        baudrate: int = 9600,
+        intervals: Optional[Dict[str, float]] = None
+    ):
+        """Register a device reached over TCP (`host`) or RTU (`serial_port`); its groups are due at once"""
+        if (host is None) == (serial_port is None):
+            raise ValueError(f"{device_id}: give exactly one of host or serial_port")
+        if isinstance(register_map, str):
+            register_map = load_register_map(register_map)
+        self.remove_device(device_id)
+        key = f"tcp://{host}:{port}" if host else f"serial://{serial_port}"
+        bus = self.buses.get(key)
+        if bus is None:
+            # Retries and reconnects are ours: pymodbus drops the connection after a timeout and
+            # the next request reconnects, instead of a background reconnect racing the poll
+            if host:
+                client = AsyncModbusTcpClient(host, port=port, timeout=self.timeout, retries=0, reconnect_delay=0)
+                bus = ModbusBus(key, client, self.gateway_concurrency)
+            else:
+                client = AsyncModbusSerialClient(
+                    serial_port, baudrate=baudrate, timeout=self.timeout, retries=0, reconnect_delay=0
+                )
+                bus = ModbusBus(key, client, 1)
+            self.buses[key] = bus
+        device = PolledDevice(device_id, unit, register_map, intervals)
+        bus.devices[device_id] = device
+        self._device_bus[device_id] = bus
+        now = time.monotonic()
+        for group in device.groups:
+            heapq.heappush(bus.heap, (now, next(self._seq), device, group))
+        bus.wake.set()
+        self._stats["devices_added"] += 1
+        if self._running:
+            self._start_bus(bus)
+
+    def remove_device(self, device_id: str):
+        """Stop polling a device; its queued jobs are dropped when they come due"""
+        bus = self._device_bus.pop(device_id, None)
+        if bus is not None:
+            bus.devices.pop(device_id, None)
+
+    def load_devices(self, devices: Iterable[Dict[str, Any]]) -> int:
+        """Add active Modbus devices from `devices` rows.
+
+        The connection comes from the ip_address / port / slave_id columns
+        and the register map from the device type (via MODBUS_REGISTER_MAPS).
+        An optional metadata["modbus"] dict overrides any of these and adds
+        serial_port, baudrate and per-group intervals.
+        """
+        added = 0
+        for device in devices:
+            if device.get("protocol") != "modbus" or device.get("is_active") is False:
+                continue
+            config = (device.get("metadata") or {}).get("modbus") or {}
+            device_type = device.get("type")
+            try:
+                serial_port = config.get("serial_port")
+                self.add_device(
+                    device["id"],
+                    config.get("register_map") or MODBUS_REGISTER_MAPS.get(device_type, device_type),
+                    unit=int(config.get("unit") or device.get("slave_id") or 1),
+                    host=None if serial_port else (config.get("host") or device.get("ip_address")),
+                    port=int(config.get("port") or device.get("port") or 502),
+                    serial_port=serial_port,
+                    baudrate=int(config.get("baudrate", 9600)),
+                    intervals=config.get("intervals"),
+                )
+                added += 1
+            except (OSError, TypeError, ValueError) as e:
+                print(f"Skipping Modbus device {device.get('id')}: {e}")
+        return added
+
+    def start(self):
+        self._running = True
+        for bus in self.buses.values():
+            self._start_bus(bus)
+
+    def _start_bus(self, bus: ModbusBus):
+        if not bus.tasks:
+            bus.tasks = [asyncio.create_task(self._worker(bus)) for _ in range(bus.concurrency)]
+
+    async def close(self):
+        self._running = False
+        for bus in self.buses.values():
+            bus.wake.set()
+            for task in bus.tasks:
+                task.cancel()
+            await asyncio.gather(*bus.tasks, return_exceptions=True)
+            bus.tasks = []
+            bus.client.close()
+
+    async def _worker(self, bus: ModbusBus):
+        # Also checked here because asyncio.wait_for can swallow a cancel that races a completed read
+        while self._running:
+            if not bus.heap:
+                bus.wake.clear()
+                await bus.wake.wait()
+                continue
+            due, _, device, group = bus.heap[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                # Woken early when a device is added with an earlier due time
+                bus.wake.clear()
+                try:
+                    await asyncio.wait_for(bus.wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(bus.heap)
+            # Removed or re-added since this job was queued
+            if bus.devices.get(device.device_id) is not device:
+                continue
+            interval, blocks = device.groups[group]
+            started = time.monotonic()
+            if device.backoff_until > started:
+                bus.stats["skipped_backoff"] += 1
+                heapq.heappush(bus.heap, (device.backoff_until, next(self._seq), device, group))
+                continue
+            bus.lag_ms.append((started - due) * 1000)
+            try:
+                await self._poll(bus, device, group, blocks)
+            except Exception as e:
+                print(f"Error polling {device.device_id}/{group} on {bus.key}: {e}")
+            # Stay on the interval grid; cycles missed while busy are skipped, not bunched up
+            finished = time.monotonic()
+            next_due = due + interval
+            if next_due <= finished:
+                next_due = due + interval * math.ceil((finished - due) / interval)
+            heapq.heappush(bus.heap, (next_due, next(self._seq), device, group))
+
+    async def _poll(self, bus: ModbusBus, device: PolledDevice, group: str, blocks: List[ReadBlock]):
+        started = time.monotonic()
+        results: List[Optional[List[int]]] = []
+        timed_out = False
+        for block in blocks:
+            words, timed_out = await self._read(bus, device.unit, block)
+            results.append(words)
+            if timed_out:
+                break
+        bus.poll_ms.append((time.monotonic() - started) * 1000)
+        bus.stats["polls"] += 1
+        if timed_out or all(words is None for words in results):
+            bus.stats["failed_polls"] += 1
+            device.failures += 1
+            if device.failures >= self.backoff_after:
+                backoff = min(self.backoff_max, self.backoff_base * 2 ** (device.failures - self.backoff_after))
+                device.backoff_until = time.monotonic() + backoff
+                self._stats["backoffs"] += 1
+        else:
+            device.failures = 0
+            device.backoff_until = 0.0
+        values = decode_blocks(blocks[:len(results)], results)
+        if not values:
+            return
+        device.last_poll = time.time()
+        self._stats["values"] += len(values)
+        if self.sink is not None:
+            await self.sink(device.device_id, values)
+
+    async def _read(self, bus: ModbusBus, unit: int, block: ReadBlock) -> Tuple[Optional[List[int]], bool]:
+        """One block request; returns (registers or None, timed out / unreachable)"""
+        client = bus.client
+        if not client.connected:
+            async with bus.connect_lock:
+                if not client.connected and not await client.connect():
+                    bus.stats["timeouts"] += 1
+                    return None, True
+        read = client.read_holding_registers if block.function_code == 3 else client.read_input_registers
+        bus.stats["requests"] += 1
+        try:
+            response = await asyncio.wait_for(read(block.start, block.count, slave=unit), self.timeout * 2)
+        except (asyncio.TimeoutError, ModbusException):
+            bus.stats["timeouts"] += 1
+            return None, True
+        if response.isError():
+            # Exception response (e.g. illegal address): the device answered, other blocks may still work
+            bus.stats["errors"] += 1
+            return None, False
+        return response.registers, False
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+
+        def pct(values, q):
+            values = sorted(values)
+            if not values:
+                return 0.0
+            return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+        return {
+            **self._stats,
+            "devices": len(self._device_bus),
+            "in_backoff": sum(
+                1 for bus in self.buses.values() for device in bus.devices.values() if device.backoff_until > now
+            ),
+            "buses": {
+                key: {
+                    **bus.stats,
+                    "devices": len(bus.devices),
+                    "connected": bool(bus.client.connected),
+                    "lag_ms": {"p50": pct(bus.lag_ms, 0.5), "p95": pct(bus.lag_ms, 0.95), "max": pct(bus.lag_ms, 1.0)},
+                    "poll_ms": {"p50": pct(bus.poll_ms, 0.5), "p95": pct(bus.poll_ms, 0.95), "max": pct(bus.poll_ms, 1.0)},
+                }
+                for key, bus in self.buses.items()
+            },
+        }
@@ -0,0 +1,98 @@
+# model_registry.py - Keep trained models in memory and hot-reload them on change
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+import joblib
+
+
+class ModelRegistry:
+    """Named models loaded once and served from memory.
+
+    Each registered name points at a file. `get` returns the in-memory model
+    and, at most every `check_interval` seconds, stats the file; when its
+    mtime changed the new file is loaded off to the side and swapped in with
+    a single assignment, so callers never see a half-loaded model. The last
+    `keep_versions` versions of each name stay in memory and can be asked
+    for explicitly.
+    """
+
+    def __init__(self, check_interval: float = 5.0, keep_versions: int = 3):
+        self.check_interval = check_interval
+        self.keep_versions = keep_versions
+        self._paths: Dict[str, Path] = {}
+        # name -> OrderedDict[version -> entry], newest last
+        self._versions: Dict[str, "OrderedDict[str, Dict[str, Any]]"] = {}
+        self._current: Dict[str, Dict[str, Any]] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, path: Path):
+        """Serve the model stored at `path` under `name`"""
+        with self._lock:
+            self._paths[name] = Path(path)
+            self._versions.setdefault(name, OrderedDict())
+            self._checked_at[name] = 0.0
+
+    def get(self, name: str, version: Optional[str] = None):
+        """Return the current (or a specific retained) model, or None if not available"""
+        if version is not None:
+            entry = self._versions.get(name, {}).get(version)
+            return entry["model"] if entry else None
+        if time.monotonic() - self._checked_at.get(name, 0.0) >= self.check_interval:
+            self.refresh(name)
+        entry = self._current.get(name)
+        return entry["model"] if entry else None
+
+    def refresh(self, name: str) -> bool:
+        """Load the model file if it changed since the last load; returns True on swap"""
+        path = self._paths[name]
+        with self._lock:
+            self._checked_at[name] = time.monotonic()
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                return False
+            version = str(stat.st_mtime_ns)
+            current = self._current.get(name)
+            if current is not None and current["version"] == version:
+                return False
+
+            started = time.perf_counter()
+            try:
+                model = joblib.load(path)
+            except Exception as e:
+                # e.g. the file is mid-write by a non-atomic writer; keep serving the old model
+                print(f"Error loading model {name} from {path}: {e}")
+                return False
+            entry = {
+                "model": model,
+                "version": version,
+                "loaded_at": datetime.utcnow().isoformat(),
+                "load_ms": round((time.perf_counter() - started) * 1000, 3),
+            }
+            versions = self._versions[name]
+            versions[version] = entry
+            while len(versions) > self.keep_versions:
+                versions.popitem(last=False)
+            self._current[name] = entry
+            return True
+
+    def info(self) -> Dict[str, Any]:
+        """Served version, load time and retained versions per model"""
+        result = {}
+        for name, path in self._paths.items():
+            current = self._current.get(name)
+            result[name] = {
+                "path": str(path),
+                "version": current["version"] if current else None,
+                "loaded_at": current["loaded_at"] if current else None,
+                "load_ms": current["load_ms"] if current else None,
+                "versions": list(self._versions.get(name, {})),
+            }
+        return result
+
+# Create a singleton instance
+model_registry = ModelRegistry()
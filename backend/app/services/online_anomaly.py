@@ -0,0 +1,168 @@
+# online_anomaly.py - Streaming per-device, per-metric anomaly scoring for live telemetry
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import time
+import numpy as np
+from ..core.config import (
+    ANOMALY_MAX_SERIES, ANOMALY_ALPHA, ANOMALY_Z_THRESHOLD, ANOMALY_WARMUP, ANOMALY_ALERT_COOLDOWN
+)
+from ..api.logging import log_warning
+from .alert_manager import raise_alert
+
+# Largest plausible change per second for metrics with physical limits
+RATE_LIMITS = {
+    "soc": 1.0,           # %/s
+    "temperature": 0.5,   # degC/s
+}
+# Smallest standard deviation a z-score is taken against, per metric; a series that was
+# flat through warm-up must move by about z_threshold times this to be flagged
+STD_FLOORS = {
+    "soc": 0.5,           # %
+    "temperature": 0.2,   # degC
+}
+MIN_STD = 1e-3
+# ... and never below this fraction of the series' mean
+RELATIVE_STD_FLOOR = 0.01
+# EWMA weight of a flagged sample relative to alpha, so outliers barely move the baseline
+# while a lasting level shift is still absorbed over time
+ANOMALY_UPDATE_WEIGHT = 0.1
+
+
+class OnlineAnomalyDetector:
+    """EWMA mean/variance per (device, metric), scored as each message arrives.
+
+    State lives in preallocated float64 arrays with one slot per tracked
+    series (mean, variance, last value, last timestamp, sample count, last
+    alert time), so memory is fixed at 48 bytes per series plus the
+    key index, whatever the message rate. A value is anomalous when its
+    z-score against the EWMA exceeds `z_threshold`, or when its rate of
+    change exceeds the metric's entry in `rate_limits`. The standard
+    deviation used for z is floored at the metric's entry in `std_floors`
+    (default MIN_STD) or RELATIVE_STD_FLOOR of the mean, whichever is
+    larger. Flagged samples update the EWMA with only
+    ANOMALY_UPDATE_WEIGHT of the usual weight. Series are only
+    scored after `warmup` samples. When `max_series` slots are taken, the
+    least recently updated series gives up its slot.
+    """
+
+    def __init__(
+        self,
+        max_series: int = ANOMALY_MAX_SERIES,
+        alpha: float = ANOMALY_ALPHA,
+        z_threshold: float = ANOMALY_Z_THRESHOLD,
+        warmup: int = ANOMALY_WARMUP,
+        alert_cooldown: float = ANOMALY_ALERT_COOLDOWN,
+        rate_limits: Optional[Dict[str, float]] = None,
+        std_floors: Optional[Dict[str, float]] = None
+    ):
+        self.max_series = max_series
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.alert_cooldown = alert_cooldown
+        self.rate_limits = RATE_LIMITS if rate_limits is None else rate_limits
+        self.std_floors = STD_FLOORS if std_floors is None else std_floors
+        self.mean = np.zeros(max_series)
+        self.var = np.zeros(max_series)
+        self.last_value = np.zeros(max_series)
+        self.last_ts = np.zeros(max_series)
+        self.count = np.zeros(max_series)
+        self.last_alert = np.full(max_series, -np.inf)
+        self._slots: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self.scored = 0
+        self.anomalies = 0
+        self.alerts = 0
+        self.evictions = 0
+
+    def _slot(self, key: Tuple[str, str]) -> int:
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._slots.move_to_end(key)
+            return slot
+        if len(self._slots) < self.max_series:
+            slot = len(self._slots)
+        else:
+            _, slot = self._slots.popitem(last=False)
+            self.evictions += 1
+        self._slots[key] = slot
+        self.count[slot] = 0
+        self.last_alert[slot] = -np.inf
+        return slot
+
+    def observe(self, device_id: str, values: Dict[str, Any], timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Score and absorb one message; returns the anomalies it contains"""
+        now = time.time() if timestamp is None else timestamp
+        names = [
+            name for name, value in values.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        ]
+        if not names:
+            return []
+        idx = np.array([self._slot((device_id, name)) for name in names])
+        x = np.array([values[name] for name in names], dtype=np.float64)
+        limits = np.array([self.rate_limits.get(name, np.inf) for name in names])
+        floors = np.array([self.std_floors.get(name, MIN_STD) for name in names])
+
+        fresh = self.count[idx] == 0
+        mean = np.where(fresh, x, self.mean[idx])
+        var = self.var[idx]
+        diff = x - mean
+        std = np.maximum(np.sqrt(var), np.maximum(floors, RELATIVE_STD_FLOOR * np.abs(mean)))
+        z = diff / std
+        elapsed = np.maximum(now - self.last_ts[idx], 1e-3)
+        rate = np.where(fresh, 0.0, np.abs(x - self.last_value[idx]) / elapsed)
+        scored = self.count[idx] >= self.warmup
+        flagged = scored & ((np.abs(z) > self.z_threshold) | (rate > limits))
+
+        alpha = np.where(flagged, self.alpha * ANOMALY_UPDATE_WEIGHT, self.alpha)
+        self.mean[idx] = mean + alpha * diff
+        self.var[idx] = (1 - alpha) * (var + alpha * diff * diff)
+        self.last_value[idx] = x
+        self.last_ts[idx] = now
+        self.count[idx] += 1
+        self.scored += int(scored.sum())
+
+        anomalies = []
+        for k in np.flatnonzero(flagged):
+            anomalies.append({
+                "device_id": device_id,
+                "metric": names[k],
+                "value": float(x[k]),
+                "expected": float(mean[k]),
+                "z_score": round(float(z[k]), 3),
+                "rate_per_s": round(float(rate[k]), 6),
+                "timestamp": now,
+                "alert": bool(now - self.last_alert[idx[k]] >= self.alert_cooldown),
+            })
+            if anomalies[-1]["alert"]:
+                self.last_alert[idx[k]] = now
+        self.anomalies += len(anomalies)
+        return anomalies
+
+    def report(self, anomalies: List[Dict[str, Any]]):
+        """Log every anomaly; raise an alert unless the series is cooling down"""
+        for anomaly in anomalies:
+            message = (
+                f"Telemetry anomaly on {anomaly['device_id']}.{anomaly['metric']}: "
+                f"{anomaly['value']} (expected ~{anomaly['expected']:.3f}, z={anomaly['z_score']})"
+            )
+            log_warning(message)
+            if anomaly["alert"]:
+                raise_alert("telemetry_anomaly", message, device_id=anomaly["device_id"], details=anomaly)
+                self.alerts += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "series": len(self._slots),
+            "max_series": self.max_series,
+            "state_bytes": sum(arr.nbytes for arr in (
+                self.mean, self.var, self.last_value, self.last_ts, self.count, self.last_alert
+            )),
+            "scored": self.scored,
+            "anomalies": self.anomalies,
+            "alerts": self.alerts,
+            "evictions": self.evictions,
+        }
+
+# Create a singleton instance
+online_anomaly_detector = OnlineAnomalyDetector()
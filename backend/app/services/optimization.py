@@ -1,5 +1,6 @@
 # optimization.py - EMS decision engine
-from app.services.ai_advisor import ai_recommend_dispatch
+import numpy as np
+from app.services.ai_advisor import ai_recommend_dispatch, ai_recommend_dispatch_batch
 from app.services.battery_manager import battery_state
 from app.services.tariff_engine import get_tariff_rate
 
@@ -29,3 +30,36 @@ def optimize_dispatch(request):
         "tariff": tariff,
         "net": net
     }
+
+def rule_based_dispatch(soc: np.ndarray) -> np.ndarray:
+    """Vectorized SoC rule: charge below 20, discharge above 90, else idle"""
+    return np.where(soc < 20, -1, np.where(soc > 90, 1, 0)).astype(np.int8)
+
+def optimize_dispatch_batch(request):
+    """Fleet-wide optimize_dispatch: same decisions for many sites in one pass.
+
+    Takes equal-length soc / pv_kw / load_kw arrays and returns columnar
+    results (one list per field, element i belongs to site i).
+    """
+    soc = np.asarray(request.soc, dtype=np.float64)
+    pv = np.asarray(request.pv_kw, dtype=np.float64)
+    load = np.asarray(request.load_kw, dtype=np.float64)
+    if not (soc.shape == pv.shape == load.shape):
+        raise ValueError("soc, pv_kw and load_kw must have the same length")
+    site_ids = getattr(request, "site_ids", None)
+    if site_ids is not None and len(site_ids) != len(soc):
+        raise ValueError("site_ids must have the same length as soc")
+
+    net = pv - load
+    tariff = np.full(soc.shape, get_tariff_rate())
+    dispatch = rule_based_dispatch(soc)
+    ai = ai_recommend_dispatch_batch(load, pv, tariff, soc)
+
+    return {
+        "site_ids": site_ids,
+        "dispatch": dispatch.tolist(),
+        "ai_advisory": ai.tolist() if ai is not None else None,
+        "battery_health": battery_state.estimate_health(),
+        "tariff": tariff.tolist(),
+        "net": net.tolist()
+    }
@@ -1,27 +1,183 @@
 import datetime
-from typing import List, Dict
+import os
+import threading
+from pathlib import Path
+from typing import List, Dict, Optional, Sequence, Tuple
+import numpy as np
 
-# Sample schedule format per device: [{hour: 10, action: "charge"}, {...}]
-schedules: Dict[str, List[dict]] = {}
+SCHEDULE_PATH = Path("app/data/schedules.npz")
+# Finest slot; hourly schedules are stored as four identical quarter-hour slots
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+RESOLUTIONS = (15, 60)
+IDLE = "idle"
+
+
+def slot_of(when: datetime.datetime) -> int:
+    return (when.hour * 60 + when.minute) // SLOT_MINUTES
+
+
+class ScheduleStore:
+    """Daily slot schedules for every device in one (devices x 96) code matrix.
+
+    Each device owns a row of quarter-hour slots holding small integer
+    action codes (0 = idle), so "action now" is a single index, a site's
+    current actions are one gather over its rows, and a whole day is
+    replaced with one row assignment. Devices scheduled hourly keep their
+    resolution for display but are stored expanded to 15-minute slots.
+    Every change is written to `path` (npz, atomic rename) and loaded
+    back on start.
+    """
+
+    def __init__(self, path: Path = SCHEDULE_PATH, autosave: bool = True):
+        self.path = path
+        self.autosave = autosave
+        self._lock = threading.Lock()
+        self._actions: List[str] = [IDLE]
+        self._codes: Dict[str, int] = {IDLE: 0}
+        self._rows: Dict[str, int] = {}
+        self._devices: List[str] = []
+        self._sites: List[Optional[str]] = []
+        self._site_rows: Dict[str, List[int]] = {}
+        self._resolution = np.zeros(0, dtype=np.int16)
+        self._slots = np.zeros((0, SLOTS_PER_DAY), dtype=np.int16)
+        if path.exists():
+            self.load()
+
+    def _code(self, action: str) -> int:
+        code = self._codes.get(action)
+        if code is None:
+            code = self._codes[action] = len(self._actions)
+            self._actions.append(action)
+        return code
+
+    def _row(self, device_id: str, site_id: Optional[str] = None) -> int:
+        row = self._rows.get(device_id)
+        if row is None:
+            row = self._rows[device_id] = len(self._devices)
+            self._devices.append(device_id)
+            self._sites.append(None)
+            if row >= len(self._slots):
+                grow = max(64, len(self._slots))
+                self._slots = np.vstack([self._slots, np.zeros((grow, SLOTS_PER_DAY), dtype=np.int16)])
+                self._resolution = np.concatenate([self._resolution, np.full(grow, 60, dtype=np.int16)])
+        if site_id is not None and self._sites[row] != site_id:
+            if self._sites[row] is not None:
+                self._site_rows[self._sites[row]].remove(row)
+            self._sites[row] = site_id
+            self._site_rows.setdefault(site_id, []).append(row)
+        return row
+
+    def set_day(self, device_id: str, actions: Sequence[str], resolution: int = 60, site_id: Optional[str] = None):
+        """Replace a device's whole day; `actions` has one entry per slot of `resolution` minutes"""
+        self.set_days([(device_id, actions, resolution, site_id)])
+
+    def set_days(self, schedules: Sequence[Tuple[str, Sequence[str], int, Optional[str]]]):
+        """Replace the day schedule of many devices, persisting once"""
+        for device_id, actions, resolution, _ in schedules:
+            if resolution not in RESOLUTIONS:
+                raise ValueError(f"Resolution must be one of {RESOLUTIONS} minutes")
+            if len(actions) != 24 * 60 // resolution:
+                raise ValueError(f"{device_id}: expected {24 * 60 // resolution} actions for {resolution}-minute slots")
+        with self._lock:
+            for device_id, actions, resolution, site_id in schedules:
+                row = self._row(device_id, site_id)
+                codes = np.array([self._code(action) for action in actions], dtype=np.int16)
+                self._slots[row] = np.repeat(codes, resolution // SLOT_MINUTES)
+                self._resolution[row] = resolution
+            self._changed()
+
+    def set_slots(self, device_id: str, items: Sequence[Tuple[int, str]], resolution: int = 60, site_id: Optional[str] = None):
+        """Set individual slots (index in `resolution`-minute slots) and leave the rest"""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Resolution must be one of {RESOLUTIONS} minutes")
+        width = resolution // SLOT_MINUTES
+        for slot, _ in items:
+            if not 0 <= slot < SLOTS_PER_DAY // width:
+                raise ValueError(f"Slot {slot} is outside the day for {resolution}-minute slots")
+        with self._lock:
+            row = self._row(device_id, site_id)
+            for slot, action in items:
+                self._slots[row, slot * width:(slot + 1) * width] = self._code(action)
+            if resolution < self._resolution[row]:
+                self._resolution[row] = resolution
+            self._changed()
+
+    def action_at(self, device_id: str, when: Optional[datetime.datetime] = None) -> str:
+        row = self._rows.get(device_id)
+        if row is None:
+            return IDLE
+        return self._actions[self._slots[row, slot_of(when or datetime.datetime.now())]]
+
+    def site_actions(self, site_id: str, when: Optional[datetime.datetime] = None) -> Dict[str, str]:
+        """Current action of every scheduled device on a site"""
+        rows = self._site_rows.get(site_id, [])
+        codes = self._slots[rows, slot_of(when or datetime.datetime.now())]
+        return {self._devices[row]: self._actions[code] for row, code in zip(rows, codes.tolist())}
+
+    def day(self, device_id: str) -> List[dict]:
+        """A device's day at its own resolution"""
+        row = self._rows.get(device_id)
+        if row is None:
+            return []
+        resolution = int(self._resolution[row])
+        codes = self._slots[row, ::resolution // SLOT_MINUTES].tolist()
+        return [
+            {"hour": i * resolution // 60, "minute": i * resolution % 60, "action": self._actions[code]}
+            for i, code in enumerate(codes) if code
+        ]
+
+    def snapshot(self) -> Tuple[List[str], np.ndarray, List[str]]:
+        """Device ids, a copy of their slot codes and the action vocabulary (for bulk readers)"""
+        with self._lock:
+            n = len(self._devices)
+            return list(self._devices), self._slots[:n].copy(), list(self._actions)
+
+    def _changed(self):
+        if self.autosave:
+            self.save()
+
+    def save(self):
+        n = len(self._devices)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.stem + ".tmp.npz")
+        np.savez(
+            tmp,
+            devices=np.array(self._devices, dtype=str),
+            sites=np.array([site or "" for site in self._sites], dtype=str),
+            actions=np.array(self._actions, dtype=str),
+            resolution=self._resolution[:n],
+            slots=self._slots[:n],
+        )
+        os.replace(tmp, self.path)
+
+    def load(self):
+        with np.load(self.path) as data:
+            devices, sites = data["devices"].tolist(), data["sites"].tolist()
+            self._actions = data["actions"].tolist()
+            self._codes = {action: i for i, action in enumerate(self._actions)}
+            self._slots = data["slots"].astype(np.int16)
+            self._resolution = data["resolution"].astype(np.int16)
+        self._devices, self._rows, self._sites, self._site_rows = [], {}, [], {}
+        for row, (device_id, site_id) in enumerate(zip(devices, sites)):
+            self._rows[device_id] = row
+            self._devices.append(device_id)
+            self._sites.append(site_id or None)
+            if site_id:
+                self._site_rows.setdefault(site_id, []).append(row)
+
+
+schedule_store = ScheduleStore()
 
 
 def schedule_action(device_id: str, hour: int, action: str):
-    global schedules
-    if device_id not in schedules:
-        schedules[device_id] = []
-    schedules[device_id].append({"hour": hour, "action": action})
-    schedules[device_id] = sorted(schedules[device_id], key=lambda x: x["hour"])
-    return schedules[device_id]
+    schedule_store.set_slots(device_id, [(hour, action)])
+    return get_schedule(device_id)
 
 
 def get_schedule(device_id: str) -> List[dict]:
-    return schedules.get(device_id, [])
+    return schedule_store.day(device_id)
 
 
 def get_action_for_current_hour(device_id: str) -> str:
-    hour = datetime.datetime.now().hour
-    todays = get_schedule(device_id)
-    for item in todays:
-        if item["hour"] == hour:
-            return item["action"]
-    return "idle"
+    return schedule_store.action_at(device_id)
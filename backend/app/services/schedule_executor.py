@@ -0,0 +1,118 @@
+# schedule_executor.py - Dispatch scheduled slot actions to devices at every slot boundary
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+import numpy as np
+from app.api.control import dispatch_commands
+from app.services.command_dispatcher import ACTION_DECISIONS
+from app.services.schedule_engine import ScheduleStore, SLOT_MINUTES, schedule_store, slot_of
+
+# Boundary reports kept for /executor (one day of quarter-hours)
+REPORT_HISTORY = 96
+
+
+def next_boundary(now: datetime) -> datetime:
+    start = now.replace(minute=now.minute - now.minute % SLOT_MINUTES, second=0, microsecond=0)
+    return start + timedelta(minutes=SLOT_MINUTES)
+
+
+class ScheduleExecutor:
+    """Applies the schedule store to the fleet, one pass per slot boundary.
+
+    The task sleeps until the next quarter-hour boundary, takes the slot
+    column of every device from the store and compares it with the last
+    action successfully dispatched to each device. Only devices whose
+    action changed are sent a command, all in one dispatch batch. Devices
+    that do not confirm keep their old applied action and are retried at
+    the next boundary.
+    The first pass runs at start-up so devices pick up the current slot.
+    """
+
+    def __init__(self, store: ScheduleStore = schedule_store):
+        self.store = store
+        # Action code last applied per store row; -1 = unknown
+        self._applied = np.full(0, -1, dtype=np.int32)
+        self.reports: deque = deque(maxlen=REPORT_HISTORY)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        # The start-up pass applies the slot already in progress
+        boundary = datetime.now()
+        while True:
+            try:
+                await self.run_boundary(boundary)
+            except Exception as e:
+                print(f"[ScheduleExecutor] Boundary {boundary.isoformat()} failed: {e}")
+            boundary = next_boundary(datetime.now())
+            # Sleep in one go, then top up if the loop woke a little early
+            while (delay := (boundary - datetime.now()).total_seconds()) > 0:
+                await asyncio.sleep(delay)
+
+    async def run_boundary(self, boundary: datetime) -> Dict[str, Any]:
+        """Dispatch every device whose action at `boundary` differs from what it is running"""
+        started = time.perf_counter()
+        devices, slots, actions = self.store.snapshot()
+        if len(self._applied) < len(devices):
+            self._applied = np.concatenate([
+                self._applied, np.full(len(devices) - len(self._applied), -1, dtype=np.int32)
+            ])
+        codes = slots[:, slot_of(boundary)].astype(np.int32)
+        changed = np.flatnonzero(codes != self._applied[:len(devices)])
+
+        # Actions with no control decision are left to whoever scheduled them
+        known = np.array([action in ACTION_DECISIONS for action in actions])
+        supported = changed[known[codes[changed]]]
+        unsupported = changed[~known[codes[changed]]]
+        self._applied[unsupported] = codes[unsupported]
+        result = await dispatch_commands(
+            [(devices[row], ACTION_DECISIONS[actions[codes[row]]]) for row in supported.tolist()]
+        ) if len(supported) else None
+        succeeded = 0
+        failures = []
+        for row, command in zip(supported.tolist(), result["results"] if result else []):
+            if command["status"] in ("delivered", "acked"):
+                self._applied[row] = codes[row]
+                succeeded += 1
+            else:
+                failures.append(f"{devices[row]}: {command['status']} {command['error'] or ''}".rstrip())
+        if failures:
+            print(f"[ScheduleExecutor] {len(failures)} dispatches failed at {boundary.isoformat()}, e.g. {failures[0]}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        report = {
+            "boundary": boundary.isoformat(),
+            "devices": len(devices),
+            "changed": len(changed),
+            "unchanged": len(devices) - len(changed),
+            "unsupported": len(unsupported),
+            "dispatched": len(supported),
+            "succeeded": succeeded,
+            "failed": len(supported) - succeeded,
+            "success_rate": round(succeeded / len(supported), 4) if len(supported) else 1.0,
+            "elapsed_ms": round(elapsed_ms, 3),
+            # How long after the boundary the last command completed
+            "lag_ms": round(max(0.0, (datetime.now() - boundary).total_seconds() * 1000), 3),
+            "command_ms": result["latency_ms"] if result else None,
+        }
+        self.reports.append(report)
+        return report
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "last": self.reports[-1] if self.reports else None,
+            "recent": list(self.reports),
+        }
+
+# Create a singleton instance
+schedule_executor = ScheduleExecutor()
@@ -1,6 +1,9 @@
 import asyncio
 from datetime import datetime
-from app.services.model_trainer import train_model
+from app.services.model_trainer import train_dispatch_model
+from app.services.ai_advisor import reload_model
+from app.services.schedule_executor import schedule_executor
+from app.services.device_connector import device_connector
 
 
 async def auto_retrain():
@@ -8,7 +11,8 @@ async def auto_retrain():
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         try:
             print(f"[Scheduler] Triggering auto-retrain at {now}")
-            result = train_model()
+            result = train_dispatch_model()
+            reload_model()
             print(f"[Scheduler] Retrain completed: {result}")
         except Exception as e:
             print(f"[Scheduler] Retrain failed: {str(e)}")
@@ -19,3 +23,11 @@ async def auto_retrain():
 def start_scheduler():
     loop = asyncio.get_event_loop()
     loop.create_task(auto_retrain())
+    schedule_executor.start()
+    loop.create_task(device_connector.start_modbus_polling())
+
+
+async def stop_scheduler():
+    """Stop the schedule executor, then close device connections and the command dispatcher"""
+    schedule_executor.stop()
+    await device_connector.close()
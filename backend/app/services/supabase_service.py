@@ -3,6 +3,9 @@ from datetime import datetime
 import uuid
 from supabase import create_client, Client
 from ..config import settings
+from ..core.config import DEVICE_CACHE_MAX_SIZE, DEVICE_CACHE_TTL
+from .ttl_cache import TTLCache
+from .db_executor import SupabaseExecutor
 
 class SupabaseService:
     def __init__(self):
@@ -10,6 +13,15 @@ class SupabaseService:
             settings.SUPABASE_URL,
             settings.SUPABASE_KEY
         )
+        # Device rows by id, and list_devices pages by (skip, limit, active_only)
+        self.device_cache = TTLCache(DEVICE_CACHE_MAX_SIZE, DEVICE_CACHE_TTL)
+        self.device_list_cache = TTLCache(256, DEVICE_CACHE_TTL)
+        # The supabase client is synchronous; run its requests in a bounded pool
+        self.executor = SupabaseExecutor()
+
+    async def _execute(self, table: str, operation: str, query):
+        """Execute a query builder without blocking the event loop"""
+        return await self.executor.run(table, operation, query.execute)
 
     async def create_device(self, device_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new device in Supabase"""
@@ -21,13 +33,21 @@ class SupabaseService:
             **device_data
         }
         
-        result = self.client.table("devices").insert(device).execute()
+        result = await self._execute("devices", "insert", self.client.table("devices").insert(device))
+        self.device_list_cache.clear()
+        self.device_cache.set(device_id, result.data[0])
         return result.data[0]
 
     async def get_device(self, device_id: str) -> Optional[Dict[str, Any]]:
-        """Get a device by ID"""
-        result = self.client.table("devices").select("*").eq("id", device_id).execute()
-        return result.data[0] if result.data else None
+        """Get a device by ID, served from the metadata cache when fresh"""
+        device = self.device_cache.get(device_id)
+        if device is not None:
+            return dict(device)
+        result = await self._execute("devices", "select", self.client.table("devices").select("*").eq("id", device_id))
+        if not result.data:
+            return None
+        self.device_cache.set(device_id, result.data[0])
+        return dict(result.data[0])
 
     async def list_devices(
         self,
@@ -36,13 +56,21 @@ class SupabaseService:
         active_only: bool = False
     ) -> List[Dict[str, Any]]:
         """List devices with optional filtering"""
+        key = (skip, limit, active_only)
+        devices = self.device_list_cache.get(key)
+        if devices is not None:
+            return [dict(device) for device in devices]
+
         query = self.client.table("devices").select("*")
         
         if active_only:
             query = query.eq("is_active", True)
         
-        result = query.range(skip, skip + limit - 1).execute()
-        return result.data
+        result = await self._execute("devices", "list", query.range(skip, skip + limit - 1))
+        self.device_list_cache.set(key, result.data)
+        for device in result.data:
+            self.device_cache.set(device["id"], device)
+        return [dict(device) for device in result.data]
 
     async def update_device(
         self,
@@ -51,12 +79,19 @@ class SupabaseService:
     ) -> Optional[Dict[str, Any]]:
         """Update a device"""
         update_data["updated_at"] = datetime.utcnow().isoformat()
-        result = self.client.table("devices").update(update_data).eq("id", device_id).execute()
-        return result.data[0] if result.data else None
+        result = await self._execute("devices", "update", self.client.table("devices").update(update_data).eq("id", device_id))
+        self.device_list_cache.clear()
+        if not result.data:
+            self.device_cache.invalidate(device_id)
+            return None
+        self.device_cache.set(device_id, result.data[0])
+        return result.data[0]
 
     async def delete_device(self, device_id: str) -> bool:
         """Delete a device"""
-        result = self.client.table("devices").delete().eq("id", device_id).execute()
+        result = await self._execute("devices", "delete", self.client.table("devices").delete().eq("id", device_id))
+        self.device_cache.invalidate(device_id)
+        self.device_list_cache.clear()
         return bool(result.data)
 
     async def create_telemetry(
@@ -66,32 +101,50 @@ class SupabaseService:
         source: str = "mqtt"
     ) -> Dict[str, Any]:
         """Create a new telemetry record"""
-        telemetry = {
+        telemetry = self.build_telemetry_row(device_id, telemetry_data, source)
+        result = await self._execute("telemetry_log", "insert", self.client.table("telemetry_log").insert(telemetry))
+        return result.data[0]
+
+    def build_telemetry_row(
+        self,
+        device_id: str,
+        telemetry_data: Dict[str, Any],
+        source: str = "mqtt"
+    ) -> Dict[str, Any]:
+        """Build a telemetry_log row without writing it"""
+        now = datetime.utcnow().isoformat()
+        return {
             "id": str(uuid.uuid4()),
             "device_id": device_id,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": now,
             "message": telemetry_data,
             "source": source,
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": now
         }
-        
-        result = self.client.table("telemetry_log").insert(telemetry).execute()
-        return result.data[0]
+
+    async def create_telemetry_batch(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert many telemetry rows in a single multi-row insert"""
+        if not rows:
+            return 0
+        result = await self._execute("telemetry_log", "insert_batch", self.client.table("telemetry_log").insert(rows))
+        return len(result.data) if result.data else 0
 
     async def get_device_telemetry(
         self,
         device_id: str,
-        limit: int = 100
+        limit: int = 100,
+        since: Optional[str] = None
     ) -> List[Dict[str, Any]]:
-        """Get telemetry data for a device"""
-        result = (
+        """Get telemetry data for a device, optionally only rows at or after `since`"""
+        query = (
             self.client.table("telemetry_log")
             .select("*")
             .eq("device_id", device_id)
-            .order("timestamp", desc=True)
-            .limit(limit)
-            .execute()
         )
+        if since:
+            query = query.gte("timestamp", since)
+        query = query.order("timestamp", desc=True).limit(limit)
+        result = await self._execute("telemetry_log", "select", query)
         return result.data
 
     async def update_device_status(
@@ -107,5 +160,77 @@ class SupabaseService:
         }
         return await self.update_device(device_id, update_data)
 
+    async def bulk_update_device_status(self, rows: List[Dict[str, Any]], chunk_size: int = 200) -> int:
+        """Update status/last_seen for many existing devices, one UPDATE per distinct value pair.
+
+        Rows are grouped by (status, last_seen) and written with
+        `update(...).in_("id", ids)`, so unknown ids match nothing instead of
+        inserting partial device rows.
+        """
+        if not rows:
+            return 0
+        groups: Dict[tuple, List[str]] = {}
+        for row in rows:
+            groups.setdefault((row["status"], row["last_seen"]), []).append(row["id"])
+
+        updated_at = datetime.utcnow().isoformat()
+        updated = 0
+        for (status, last_seen), ids in groups.items():
+            update_data = {"status": status, "last_seen": last_seen, "updated_at": updated_at}
+            for i in range(0, len(ids), chunk_size):
+                chunk = ids[i:i + chunk_size]
+                query = self.client.table("devices").update(update_data).in_("id", chunk)
+                result = await self._execute("devices", "update_status", query)
+                updated += len(result.data) if result.data else 0
+            for device_id in ids:
+                device = self.device_cache.peek(device_id)
+                if device is not None:
+                    self.device_cache.set(device_id, {**device, **update_data})
+        self.device_list_cache.clear()
+        return updated
+
+    async def merge_telemetry_rollups(self, batch_id: str, rows: List[Dict[str, Any]]) -> int:
+        """Merge closed rollup buckets into stored ones in one RPC call.
+
+        The merge_telemetry_rollups function adds counts and combines
+        min/max/mean with any row already stored for the same bucket. A
+        `batch_id` it has already applied is ignored (returns 0), so a batch
+        may be re-sent after a timeout.
+        """
+        if not rows:
+            return 0
+        query = self.client.rpc("merge_telemetry_rollups", {"p_batch_id": batch_id, "p_rows": rows})
+        result = await self._execute("telemetry_rollup", "merge", query)
+        return result.data or 0
+
+    async def get_telemetry_rollups(
+        self,
+        device_id: str,
+        resolution: str,
+        start: str,
+        end: str,
+        metric: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Get rollup buckets for a device in [start, end)"""
+        query = (
+            self.client.table("telemetry_rollup")
+            .select("metric,resolution,bucket_start,min,max,mean,last,count")
+            .eq("device_id", device_id)
+            .eq("resolution", resolution)
+            .gte("bucket_start", start)
+            .lt("bucket_start", end)
+        )
+        if metric:
+            query = query.eq("metric", metric)
+        result = await self._execute("telemetry_rollup", "select", query.order("bucket_start"))
+        return result.data
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction stats for the device metadata caches"""
+        return {
+            "devices": self.device_cache.stats(),
+            "device_lists": self.device_list_cache.stats(),
+        }
+
 # Create a singleton instance
 supabase_service = SupabaseService() 
\ No newline at end of file
@@ -1,5 +1,11 @@
 # tariff_engine.py - Israeli ToU + export tariff calculator
-from datetime import datetime
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
 
 # Simulated hourly tariff rates
 TARIFF_RATES = {
@@ -9,17 +15,164 @@ TARIFF_RATES = {
     "feed_in": 0.48
 }
 
+DAY_TYPES = ("weekday", "weekend", "holiday")
+ALL = "all"
+
+
+@dataclass(frozen=True)
+class TariffDefinition:
+    """A time-of-use tariff.
+
+    `schedule` rows are (season, day_type, start_hour, end_hour, period);
+    `season`/`day_type` may be "all", and later rows override earlier ones.
+    Holidays use the "holiday" rows and fall back to "weekend" rows for
+    hours no holiday row covers. `weekend_days` are weekday numbers
+    (Monday=0). Timestamps are interpreted in `timezone`; naive ones are
+    assumed to be local already. Everything is tuples so the definition is
+    hashable and can key the compiled-timeline cache.
+    """
+    name: str
+    rates: Tuple[Tuple[str, float], ...]
+    schedule: Tuple[Tuple[str, str, int, int, str], ...]
+    seasons: Tuple[Tuple[str, Tuple[int, ...]], ...] = ((ALL, tuple(range(1, 13))),)
+    feed_in_rate: float = TARIFF_RATES["feed_in"]
+    feed_in_rates: Tuple[Tuple[str, float], ...] = ()
+    weekend_days: Tuple[int, ...] = (4, 5)
+    holidays: Tuple[str, ...] = ()
+    timezone: str = "Asia/Jerusalem"
+
+
+DEFAULT_TARIFF = TariffDefinition(
+    name="default",
+    rates=tuple((k, v) for k, v in TARIFF_RATES.items() if k != "feed_in"),
+    schedule=(
+        (ALL, ALL, 0, 6, "off_peak"),
+        (ALL, ALL, 6, 17, "mid_peak"),
+        (ALL, ALL, 17, 22, "on_peak"),
+        (ALL, ALL, 22, 24, "off_peak"),
+    ),
+)
+
+
+class TariffTimeline:
+    """Hourly period codes for a tariff, compiled for whole years.
+
+    Compilation turns the definition into a (month, day type, hour) ->
+    period table and then expands it, with the holiday calendar applied,
+    into one code per hour of every covered year. A lookup is then a
+    single gather by hours-since-epoch. Coverage grows on demand when
+    timestamps outside the compiled years are asked for.
+    """
+
+    def __init__(self, definition: TariffDefinition):
+        self.definition = definition
+        self.periods = [name for name, _ in definition.rates]
+        index = {name: i for i, name in enumerate(self.periods)}
+        self.import_rates = np.array([rate for _, rate in definition.rates], dtype=np.float64)
+        feed_in = dict(definition.feed_in_rates)
+        self.export_rates = np.array(
+            [feed_in.get(name, definition.feed_in_rate) for name in self.periods], dtype=np.float64
+        )
+        self._table = self._compile_table(index)
+        self._holidays = np.array(sorted(definition.holidays), dtype="datetime64[D]")
+        self._weekend = np.zeros(7, dtype=bool)
+        self._weekend[list(definition.weekend_days)] = True
+        # (codes, base hour) replaced as one object so lock-free readers see a consistent pair
+        self._timeline = (np.empty(0, dtype=np.int8), 0)
+        self._years: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def _compile_table(self, index: Dict[str, int]) -> np.ndarray:
+        months = {name: months for name, months in self.definition.seasons}
+        table = np.full((12, len(DAY_TYPES), 24), -1, dtype=np.int8)
+        for season, day_type, start, end, period in self.definition.schedule:
+            if period not in index:
+                raise ValueError(f"Tariff {self.definition.name}: unknown period '{period}'")
+            season_months = range(1, 13) if season == ALL else months[season]
+            day_types = range(len(DAY_TYPES)) if day_type == ALL else [DAY_TYPES.index(day_type)]
+            for month in season_months:
+                for d in day_types:
+                    table[month - 1, d, start:end] = index[period]
+        # Holiday hours not covered by a holiday rule use the weekend rule
+        holiday, weekend = DAY_TYPES.index("holiday"), DAY_TYPES.index("weekend")
+        table[:, holiday] = np.where(table[:, holiday] < 0, table[:, weekend], table[:, holiday])
+        if (table < 0).any():
+            raise ValueError(f"Tariff {self.definition.name}: schedule does not cover every hour")
+        return table
+
+    def _ensure(self, first_year: int, last_year: int):
+        with self._lock:
+            if self._years and self._years[0] <= first_year and last_year <= self._years[1]:
+                return
+            if self._years:
+                first_year, last_year = min(first_year, self._years[0]), max(last_year, self._years[1])
+            start = np.datetime64(f"{first_year}-01-01T00", "h")
+            end = np.datetime64(f"{last_year + 1}-01-01T00", "h")
+            hours = np.arange(start, end)
+            days = hours.astype("datetime64[D]")
+            month = days.astype("datetime64[M]").astype(np.int64) % 12
+            # 1970-01-01 was a Thursday (Monday=0)
+            weekday = (days.astype(np.int64) + 3) % 7
+            day_type = np.where(self._weekend[weekday], 1, 0)
+            if len(self._holidays):
+                day_type = np.where(np.isin(days, self._holidays), 2, day_type)
+            hour = hours.astype(np.int64) % 24
+            self._timeline = (self._table[month, day_type, hour], int(start.astype(np.int64)))
+            self._years = (first_year, last_year)
+
+    def local_times(self, timestamps) -> np.ndarray:
+        """Timestamps as naive datetime64 in the tariff's timezone"""
+        if np.ndim(timestamps) == 0:
+            timestamps = [timestamps]
+        index = pd.DatetimeIndex(pd.to_datetime(timestamps))
+        if index.tz is not None:
+            index = index.tz_convert(self.definition.timezone).tz_localize(None)
+        return index.values
+
+    def period_codes(self, timestamps, local: bool = False) -> np.ndarray:
+        """Index into `self.periods` for every timestamp (`local`: already from local_times)"""
+        times = timestamps if local else self.local_times(timestamps)
+        hours = np.asarray(times).astype("datetime64[h]").astype(np.int64)
+        if not len(hours):
+            return np.empty(0, dtype=np.int8)
+        first = np.datetime64(int(hours.min()), "h").astype("datetime64[Y]").astype(int) + 1970
+        last = np.datetime64(int(hours.max()), "h").astype("datetime64[Y]").astype(int) + 1970
+        self._ensure(int(first), int(last))
+        codes, base = self._timeline
+        return codes[hours - base]
+
+    def rates(self, timestamps, export: bool = False) -> np.ndarray:
+        """Import (or feed-in) rate for every timestamp"""
+        table = self.export_rates if export else self.import_rates
+        return table[self.period_codes(timestamps)]
+
+    def period_names(self, timestamps) -> np.ndarray:
+        return np.array(self.periods, dtype=object)[self.period_codes(timestamps)]
+
+
+@lru_cache(maxsize=32)
+def compile_tariff(definition: TariffDefinition = DEFAULT_TARIFF) -> TariffTimeline:
+    """Compiled timeline for a definition, cached per definition"""
+    return TariffTimeline(definition)
+
+
+def tariff_rates(timestamps, export: bool = False, definition: TariffDefinition = DEFAULT_TARIFF) -> np.ndarray:
+    """Vectorized rate lookup for an array/Series/DatetimeIndex of timestamps"""
+    return compile_tariff(definition).rates(timestamps, export)
+
+
+def tariff_rate_at(when: datetime, export: bool = False, definition: TariffDefinition = DEFAULT_TARIFF) -> float:
+    return float(tariff_rates([when], export, definition)[0])
+
+
 def get_tariff_rate():
-    hour = datetime.now().hour
-    if 0 <= hour < 6:
-        return TARIFF_RATES["off_peak"]
-    elif 6 <= hour < 17:
-        return TARIFF_RATES["mid_peak"]
-    elif 17 <= hour < 22:
-        return TARIFF_RATES["on_peak"]
-    else:
-        return TARIFF_RATES["off_peak"]
-
-def calculate_energy_cost(kwh: float, export: bool = False):
-    rate = TARIFF_RATES["feed_in"] if export else get_tariff_rate()
-    return round(kwh * rate, 2)# tariff_engine.py
+    return tariff_rate_at(datetime.now())
+
+def tariff_rate_for_hour(hour: int, day: Optional[date] = None):
+    day = day or date.today()
+    return tariff_rate_at(datetime(day.year, day.month, day.day, hour))
+
+def calculate_energy_cost(kwh: float, export: bool = False, when: Optional[datetime] = None):
+    rate = tariff_rate_at(when or datetime.now(), export)
+    return round(kwh * rate, 2)
+# tariff_engine.py
@@ -0,0 +1,175 @@
+# telemetry_buffer.py - In-memory columnar ring buffer of recent telemetry per device
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime
+import time
+import numpy as np
+from ..core.config import TELEMETRY_BUFFER_CAPACITY, TELEMETRY_BUFFER_MAX_METRICS, TELEMETRY_BUFFER_MAX_DEVICES
+
+
+class DeviceRingBuffer:
+    """Fixed-capacity ring of numeric telemetry for one device.
+
+    Timestamps (epoch seconds) and each metric live in their own float64
+    array of length `capacity`; a metric missing from a message is NaN.
+    At most `max_metrics` metric columns are kept, so memory per device is
+    bounded by capacity * 8 * (1 + max_metrics) bytes.
+    """
+
+    def __init__(self, capacity: int, max_metrics: int):
+        self.capacity = capacity
+        self.max_metrics = max_metrics
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.metrics: Dict[str, np.ndarray] = {}
+        self._next = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def oldest(self) -> Optional[float]:
+        """Timestamp of the oldest retained sample"""
+        if not self._count:
+            return None
+        return float(self.timestamps[(self._next - self._count) % self.capacity])
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + sum(arr.nbytes for arr in self.metrics.values())
+
+    def append(self, timestamp: float, values: Dict[str, Any]):
+        """Store one message, keeping only its numeric fields"""
+        i = self._next
+        self.timestamps[i] = timestamp
+        for arr in self.metrics.values():
+            arr[i] = np.nan
+        for name, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            arr = self.metrics.get(name)
+            if arr is None:
+                if len(self.metrics) >= self.max_metrics:
+                    continue
+                arr = np.full(self.capacity, np.nan, dtype=np.float64)
+                self.metrics[name] = arr
+            arr[i] = value
+        self._next = (i + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _newest_first(self, n: int) -> np.ndarray:
+        n = min(n, self._count)
+        return (self._next - 1 - np.arange(n)) % self.capacity
+
+    def latest(self, n: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Return the newest `n` samples, newest first"""
+        idx = self._newest_first(n)
+        return self.timestamps[idx], {name: arr[idx] for name, arr in self.metrics.items()}
+
+    def since(self, cutoff: float, limit: Optional[int] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Return samples with timestamp >= `cutoff`, newest first"""
+        idx = self._newest_first(self._count)
+        idx = idx[self.timestamps[idx] >= cutoff]
+        if limit is not None:
+            idx = idx[:limit]
+        return self.timestamps[idx], {name: arr[idx] for name, arr in self.metrics.items()}
+
+
+def columns_to_rows(device_id: str, timestamps: np.ndarray, columns: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """Convert buffer columns to telemetry_log-shaped rows, dropping NaN fields"""
+    rows = []
+    for i, ts in enumerate(timestamps):
+        message = {}
+        for name, arr in columns.items():
+            value = arr[i]
+            if not np.isnan(value):
+                message[name] = float(value)
+        rows.append({
+            "device_id": device_id,
+            "timestamp": datetime.utcfromtimestamp(ts).isoformat(),
+            "message": message,
+            "source": "buffer"
+        })
+    return rows
+
+
+def compact_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Reduce telemetry_log rows to the shape `columns_to_rows` produces"""
+    compact = []
+    for row in rows:
+        message = row.get("message") or {}
+        compact.append({
+            "device_id": row["device_id"],
+            "timestamp": row["timestamp"],
+            "message": {
+                name: float(value) for name, value in message.items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+            },
+            "source": row.get("source"),
+        })
+    return compact
+
+
+class TelemetryBuffer:
+    """Per-device ring buffers, holding at most `max_devices` devices.
+
+    The least recently written device is dropped when a new one would
+    exceed `max_devices`.
+    """
+
+    def __init__(
+        self,
+        capacity: int = TELEMETRY_BUFFER_CAPACITY,
+        max_metrics: int = TELEMETRY_BUFFER_MAX_METRICS,
+        max_devices: int = TELEMETRY_BUFFER_MAX_DEVICES
+    ):
+        self.capacity = capacity
+        self.max_metrics = max_metrics
+        self.max_devices = max_devices
+        self._buffers: "OrderedDict[str, DeviceRingBuffer]" = OrderedDict()
+        self.evictions = 0
+
+    def append(self, device_id: str, values: Dict[str, Any], timestamp: Optional[float] = None):
+        """Record one telemetry message for a device"""
+        buf = self._buffers.get(device_id)
+        if buf is None:
+            buf = DeviceRingBuffer(self.capacity, self.max_metrics)
+            self._buffers[device_id] = buf
+            if len(self._buffers) > self.max_devices:
+                self._buffers.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._buffers.move_to_end(device_id)
+        buf.append(time.time() if timestamp is None else timestamp, values)
+
+    def get(self, device_id: str) -> Optional[DeviceRingBuffer]:
+        return self._buffers.get(device_id)
+
+    def latest(self, device_id: str, n: int) -> Optional[List[Dict[str, Any]]]:
+        """Newest `n` rows, or None if the buffer holds fewer than `n`"""
+        buf = self._buffers.get(device_id)
+        if buf is None or len(buf) < n:
+            return None
+        return columns_to_rows(device_id, *buf.latest(n))
+
+    def since(self, device_id: str, seconds: float, limit: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """Rows from the last `seconds`, or None if the buffer does not reach back that far"""
+        buf = self._buffers.get(device_id)
+        cutoff = time.time() - seconds
+        if buf is None or buf.oldest is None or buf.oldest > cutoff:
+            return None
+        return columns_to_rows(device_id, *buf.since(cutoff, limit))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "devices": len(self._buffers),
+            "max_devices": self.max_devices,
+            "capacity_per_device": self.capacity,
+            "max_metrics_per_device": self.max_metrics,
+            "max_bytes_per_device": self.capacity * 8 * (1 + self.max_metrics),
+            "bytes": sum(buf.nbytes for buf in self._buffers.values()),
+            "evictions": self.evictions,
+        }
+
+# Create a singleton instance
+telemetry_buffer = TelemetryBuffer()
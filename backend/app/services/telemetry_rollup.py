@@ -0,0 +1,268 @@
+# telemetry_rollup.py - Incremental 1m / 15m / 1h telemetry aggregates
+from typing import Any, Dict, List, Optional, Tuple
+from collections import deque
+from datetime import datetime
+import asyncio
+import time
+import uuid
+from postgrest.exceptions import APIError
+from .supabase_service import supabase_service
+from ..core.config import ROLLUP_FLUSH_INTERVAL, ROLLUP_MAX_PENDING
+
+# Resolution name -> bucket width in seconds, finest first
+RESOLUTIONS = {"1m": 60, "15m": 900, "1h": 3600}
+
+
+def pick_resolution(start: float, end: float, max_points: int) -> str:
+    """Finest resolution whose bucket count over [start, end) fits in `max_points`.
+
+    Falls back to the coarsest resolution when none fits.
+    """
+    span = max(end - start, 0)
+    for name, width in RESOLUTIONS.items():
+        if span / width <= max_points:
+            return name
+    return list(RESOLUTIONS)[-1]
+
+
+class TelemetryRollup:
+    """Maintain min/max/mean/last/count per device, metric and resolution.
+
+    Each (device, metric, resolution) keeps one open bucket that is updated
+    in place as samples arrive. When a sample falls in a later bucket, or a
+    flush finds the bucket's window has passed, the bucket is closed and
+    queued; closed buckets are merged into `telemetry_rollup` in bulk, so
+    a bucket persisted in parts (e.g. across a restart) keeps all samples.
+
+    Every flush batch carries an id the database records with the merge.
+    A batch that failed in transit is re-sent under the same id, so it is
+    applied at most once even if the timed-out call did land. A batch the
+    database rejected was rolled back; it is split in halves and retried,
+    and a single bucket that is still rejected (e.g. an unknown device id)
+    is dropped instead of blocking every later flush.
+    """
+
+    def __init__(self, flush_interval: float = ROLLUP_FLUSH_INTERVAL, max_pending: int = ROLLUP_MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # (device_id, metric, resolution) -> [bucket_start, min, max, sum, count, last]
+        self._open: Dict[Tuple[str, str, str], List[float]] = {}
+        self._pending = deque(maxlen=max_pending)
+        # (batch_id, rows) that failed in transit, re-sent as-is on the next flush
+        self._retry: deque = deque()
+        self._retry_rows = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "samples": 0,
+            "late_samples": 0,
+            "buckets_closed": 0,
+            "buckets_written": 0,
+            "flush_errors": 0,
+            "buckets_rejected": 0,
+            "buckets_dropped": 0,
+        }
+
+    def start(self):
+        """Start the periodic flush task on the running event loop"""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def add(self, device_id: str, values: Dict[str, Any], timestamp: Optional[float] = None):
+        """Fold the numeric fields of one message into every resolution"""
+        ts = time.time() if timestamp is None else timestamp
+        for metric, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            self._stats["samples"] += 1
+            for resolution, width in RESOLUTIONS.items():
+                start = ts - ts % width
+                key = (device_id, metric, resolution)
+                bucket = self._open.get(key)
+                if bucket is not None:
+                    # A sample for an older window, or for one already closed and queued
+                    if start < bucket[0] or (start == bucket[0] and not bucket[4]):
+                        self._stats["late_samples"] += 1
+                        continue
+                    if start > bucket[0]:
+                        if bucket[4]:
+                            self._close(key, bucket)
+                        bucket = None
+                if bucket is None:
+                    self._open[key] = [start, value, value, value, 1, value]
+                else:
+                    if value < bucket[1]:
+                        bucket[1] = value
+                    if value > bucket[2]:
+                        bucket[2] = value
+                    bucket[3] += value
+                    bucket[4] += 1
+                    bucket[5] = value
+        if self._task is None:
+            self.start()
+
+    def _close(self, key: Tuple[str, str, str], bucket: List[float]):
+        """Queue a bucket for persistence and mark it closed (count 0)"""
+        self._pending.append(_to_row(key, bucket))
+        bucket[4] = 0
+        self._stats["buckets_closed"] += 1
+
+    def close_expired(self, now: Optional[float] = None):
+        """Close open buckets whose time window has already ended"""
+        now = time.time() if now is None else now
+        for key, bucket in self._open.items():
+            if bucket[4] and bucket[0] + RESOLUTIONS[key[2]] <= now:
+                self._close(key, bucket)
+
+    async def flush(self) -> int:
+        """Persist all closed buckets, plus batches left over from failed flushes"""
+        self.close_expired()
+        batches = list(self._retry)
+        self._retry.clear()
+        self._retry_rows = 0
+        if self._pending:
+            batches.append((str(uuid.uuid4()), list(self._pending)))
+            self._pending.clear()
+        written = 0
+        while batches:
+            batch_id, rows = batches.pop()
+            try:
+                await supabase_service.merge_telemetry_rollups(batch_id, rows)
+            except APIError as e:
+                # Rejected and rolled back: narrow down to the offending buckets
+                self._stats["flush_errors"] += 1
+                if len(rows) == 1:
+                    self._stats["buckets_rejected"] += 1
+                    print(f"Dropping telemetry rollup bucket {rows[0]['device_id']}/{rows[0]['metric']}: {e}")
+                    continue
+                mid = len(rows) // 2
+                batches.append((str(uuid.uuid4()), rows[:mid]))
+                batches.append((str(uuid.uuid4()), rows[mid:]))
+                continue
+            except Exception as e:
+                # Timeout or transport error: the merge may or may not have run, keep the id
+                # The database is likely unreachable; leave the rest for the next flush too
+                self._stats["flush_errors"] += 1
+                print(f"Error writing {len(rows)} telemetry rollup buckets: {e}")
+                for batch in [(batch_id, rows)] + batches[::-1]:
+                    self._requeue(*batch)
+                break
+            written += len(rows)
+        self._stats["buckets_written"] += written
+        return written
+
+    def _requeue(self, batch_id: str, rows: List[Dict[str, Any]]):
+        """Keep a batch for the next flush; beyond `max_pending` buckets the oldest batches go"""
+        self._retry.appendleft((batch_id, rows))
+        self._retry_rows += len(rows)
+        while self._retry_rows > self.max_pending and len(self._retry) > 1:
+            _, dropped = self._retry.pop()
+            self._retry_rows -= len(dropped)
+            self._stats["buckets_dropped"] += len(dropped)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        """Stop the flush task and persist everything, including open buckets"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for key, bucket in self._open.items():
+            if bucket[4]:
+                self._close(key, bucket)
+        await self.flush()
+
+    def in_memory(self, device_id: str, resolution: str, start: float, end: float, metric: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Buckets not yet persisted (queued and open) for a device"""
+        queued = list(self._pending) + [row for _, batch in self._retry for row in batch]
+        rows = [
+            row for row in queued
+            if row["device_id"] == device_id and row["resolution"] == resolution
+        ]
+        rows += [
+            _to_row(key, bucket) for key, bucket in self._open.items()
+            if key[0] == device_id and key[2] == resolution and bucket[4]
+        ]
+        start_iso, end_iso = _iso(start), _iso(end)
+        return [
+            row for row in rows
+            if start_iso <= row["bucket_start"] < end_iso and (metric is None or row["metric"] == metric)
+        ]
+
+    async def query(
+        self,
+        device_id: str,
+        start: float,
+        end: float,
+        max_points: int = 500,
+        metric: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Return rollup rows for a time range at the resolution that fits `max_points`"""
+        resolution = pick_resolution(start, end, max_points)
+        stored = await supabase_service.get_telemetry_rollups(
+            device_id, resolution, _iso(start), _iso(end), metric
+        )
+        merged = {}
+        for row in stored:
+            row["bucket_start"] = _normalize(row["bucket_start"])
+            merged[(row["metric"], row["bucket_start"])] = row
+        for row in self.in_memory(device_id, resolution, start, end, metric):
+            key = (row["metric"], row["bucket_start"])
+            merged[key] = _merge_rows(merged[key], row) if key in merged else row
+        rows = sorted(merged.values(), key=lambda row: (row["metric"], row["bucket_start"]))
+        return {"device_id": device_id, "resolution": resolution, "rows": rows}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "open_buckets": sum(1 for bucket in self._open.values() if bucket[4]),
+            "pending_buckets": len(self._pending),
+            "retry_buckets": self._retry_rows,
+        }
+
+
+def _iso(ts: float) -> str:
+    return datetime.utcfromtimestamp(ts).isoformat()
+
+
+def _normalize(value: str) -> str:
+    """Render a stored UTC timestamp the same way as `_iso`"""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None).isoformat()
+
+
+def _merge_rows(stored: Dict[str, Any], newer: Dict[str, Any]) -> Dict[str, Any]:
+    """Combine two partial aggregates of one bucket, as merge_telemetry_rollups does"""
+    count = stored["count"] + newer["count"]
+    return {
+        **newer,
+        "min": min(stored["min"], newer["min"]),
+        "max": max(stored["max"], newer["max"]),
+        "mean": (stored["mean"] * stored["count"] + newer["mean"] * newer["count"]) / count,
+        "count": count,
+    }
+
+
+def _to_row(key: Tuple[str, str, str], bucket: List[float]) -> Dict[str, Any]:
+    device_id, metric, resolution = key
+    start, vmin, vmax, total, count, last = bucket
+    return {
+        "device_id": device_id,
+        "metric": metric,
+        "resolution": resolution,
+        "bucket_start": _iso(start),
+        "min": vmin,
+        "max": vmax,
+        "mean": total / count,
+        "last": last,
+        "count": count,
+    }
+
+# Create a singleton instance
+telemetry_rollup = TelemetryRollup()
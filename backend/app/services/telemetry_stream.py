@@ -0,0 +1,202 @@
+# telemetry_stream.py - Push live telemetry to subscribed WebSocket clients, throttled and coalesced
+from typing import Any, Dict, Iterable, Optional, Set
+import asyncio
+import json
+import time
+from ..core.config import STREAM_DEFAULT_RATE, STREAM_MAX_RATE, STREAM_TICK
+from .broadcast_hub import BroadcastHub, ClientConnection, broadcast_hub
+
+
+class Subscription:
+    """What one client wants and what is waiting to be sent to it"""
+
+    def __init__(self, client: ClientConnection):
+        self.client = client
+        self.devices: Set[str] = set()
+        self.sites: Set[str] = set()
+        self.metrics: Optional[Set[str]] = None  # None = all metrics
+        # Subscribed without naming devices or sites: follow every device
+        self.all_devices = False
+        self.interval = 1.0 / STREAM_DEFAULT_RATE
+        self.delta = False
+        self.next_send = 0.0
+        # device_id -> latest value per metric since the last frame
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        # device_id -> last value sent per metric, for delta encoding
+        self.sent: Dict[str, Dict[str, Any]] = {}
+
+
+def _names(command: Dict[str, Any], key: str) -> Set[str]:
+    """The set of ids/names under `key`; must be a list of strings when present"""
+    values = command.get(key)
+    if values is None:
+        return set()
+    if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+        raise ValueError(f"'{key}' must be a list of strings")
+    return set(values)
+
+
+class TelemetryStream:
+    """Routes ingested telemetry to the clients subscribed to it.
+
+    Clients subscribe by device ids, site ids and/or metric names; naming
+    no devices or sites follows every device.
+    `publish` looks up matching subscriptions through per-device and
+    per-site indexes and merges the message into each one's pending map,
+    so within a client's throttle window only the latest value per metric
+    survives. A flush task sends each client at most one frame per
+    interval (its requested rate, capped at `max_rate`); with `delta` a
+    frame carries only the fields that changed since the previous one.
+    Frames are non-essential, so clients the hub has downgraded stop
+    receiving them.
+    """
+
+    def __init__(self, hub: BroadcastHub = broadcast_hub, max_rate: float = STREAM_MAX_RATE, tick: float = STREAM_TICK):
+        self.hub = hub
+        self.max_rate = max_rate
+        self.tick = tick
+        self._subs: Dict[ClientConnection, Subscription] = {}
+        self._by_device: Dict[str, Set[Subscription]] = {}
+        self._by_site: Dict[str, Set[Subscription]] = {}
+        self._all: Set[Subscription] = set()
+        self._dirty: Set[Subscription] = set()
+        # Last site seen per device, so site subscriptions match messages without a site_id
+        self._device_sites: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"published": 0, "routed": 0, "frames": 0, "coalesced": 0}
+
+    def _index(self, sub: Subscription, add: bool):
+        for index, keys in ((self._by_device, sub.devices), (self._by_site, sub.sites)):
+            for key in keys:
+                if add:
+                    index.setdefault(key, set()).add(sub)
+                    continue
+                subs = index.get(key)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del index[key]
+        if add and sub.all_devices:
+            self._all.add(sub)
+        else:
+            self._all.discard(sub)
+
+    def handle(self, client: ClientConnection, command: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply a subscribe/unsubscribe command from a client; returns the ack to send back"""
+        action = command.get("action")
+        if action not in ("subscribe", "unsubscribe"):
+            return {"type": "error", "detail": f"Unknown action '{action}'"}
+        # Parse before touching the indexes so a bad value leaves the subscription intact
+        rate = min(max(float(command["max_rate"]), 0.01), self.max_rate) if "max_rate" in command else None
+        devices, sites, metrics = (_names(command, k) for k in ("devices", "sites", "metrics"))
+        sub = self._subs.get(client)
+        if sub is None:
+            sub = self._subs[client] = Subscription(client)
+        self._index(sub, add=False)
+
+        if action == "subscribe":
+            sub.devices |= devices
+            sub.sites |= sites
+            sub.all_devices = not (sub.devices or sub.sites)
+            if metrics:
+                sub.metrics = (sub.metrics or set()) | metrics
+            if rate is not None:
+                sub.interval = 1.0 / rate
+            if "delta" in command:
+                sub.delta = bool(command["delta"])
+        else:
+            sub.devices -= devices
+            sub.sites -= sites
+            if metrics and sub.metrics is not None:
+                sub.metrics -= metrics
+            if not (devices or sites or metrics) or not (sub.devices or sub.sites or sub.all_devices):
+                self.remove(client)
+                return {"type": "unsubscribed"}
+
+        self._index(sub, add=True)
+        self._ensure_flusher()
+        return {
+            "type": "subscribed",
+            "devices": sorted(sub.devices),
+            "sites": sorted(sub.sites),
+            "metrics": sorted(sub.metrics) if sub.metrics is not None else None,
+            "max_rate": round(1.0 / sub.interval, 3),
+            "delta": sub.delta,
+        }
+
+    def remove(self, client: ClientConnection):
+        """Drop a client's subscription (on disconnect)"""
+        sub = self._subs.pop(client, None)
+        if sub is not None:
+            self._index(sub, add=False)
+            self._dirty.discard(sub)
+
+    def publish(self, device_id: str, values: Dict[str, Any], site_id: Optional[str] = None):
+        """Offer one ingested message to matching subscriptions; never blocks"""
+        if not self._subs:
+            return
+        self._stats["published"] += 1
+        if site_id is not None:
+            self._device_sites[device_id] = site_id
+        else:
+            site_id = self._device_sites.get(device_id)
+        targets: Iterable[Subscription] = self._by_device.get(device_id, set()) | self._all
+        if site_id is not None and site_id in self._by_site:
+            targets = targets | self._by_site[site_id]
+        for sub in targets:
+            fields = values if sub.metrics is None else {k: v for k, v in values.items() if k in sub.metrics}
+            if not fields:
+                continue
+            pending = sub.pending.setdefault(device_id, {})
+            self._stats["coalesced"] += sum(1 for k in fields if k in pending)
+            pending.update(fields)
+            self._dirty.add(sub)
+            self._stats["routed"] += 1
+
+    def _ensure_flusher(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._subs:
+            await asyncio.sleep(self.tick)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing telemetry stream: {e}")
+
+    def flush(self, now: Optional[float] = None):
+        """Send one frame to every dirty subscription whose window has elapsed"""
+        now = time.monotonic() if now is None else now
+        for sub in [s for s in self._dirty if s.next_send <= now]:
+            self._dirty.discard(sub)
+            pending, sub.pending = sub.pending, {}
+            if sub.client.degraded:
+                continue
+            if sub.delta:
+                frame = {}
+                for device_id, fields in pending.items():
+                    last = sub.sent.setdefault(device_id, {})
+                    changed = {k: v for k, v in fields.items() if last.get(k, ...) != v}
+                    if changed:
+                        last.update(changed)
+                        frame[device_id] = changed
+            else:
+                frame = pending
+            if not frame:
+                continue
+            self.hub.send(sub.client, json.dumps({"type": "telemetry", "ts": time.time(), "devices": frame}, default=str))
+            sub.next_send = now + sub.interval
+            self._stats["frames"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "subscribers": len(self._subs),
+            "pending_subscribers": len(self._dirty),
+            "indexed_devices": len(self._by_device),
+            "indexed_sites": len(self._by_site),
+        }
+
+# Create a singleton instance
+telemetry_stream = TelemetryStream()
@@ -0,0 +1,149 @@
+# telemetry_writer.py - Buffered, batched telemetry_log writer
+from typing import Dict, Any, List, Optional
+import asyncio
+import time
+from postgrest.exceptions import APIError
+from .supabase_service import supabase_service
+from ..core.config import TELEMETRY_BATCH_SIZE, TELEMETRY_FLUSH_INTERVAL, TELEMETRY_MAX_QUEUE
+
+
+class TelemetryBatchWriter:
+    """Collect telemetry rows in memory and flush them as multi-row inserts.
+
+    A flush happens when `batch_size` rows are buffered or `flush_interval`
+    seconds have passed since the first buffered row, whichever comes first.
+    The queue is bounded by `max_queue`; `submit` waits when it is full so
+    producers slow down instead of growing memory. When the database rejects
+    a batch (e.g. a row for a device id not in `devices`), the batch is
+    split in halves and retried so only the offending rows are lost.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = TELEMETRY_BATCH_SIZE,
+        flush_interval: float = TELEMETRY_FLUSH_INTERVAL,
+        max_queue: int = TELEMETRY_MAX_QUEUE
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._stats = {
+            "rows_submitted": 0,
+            "rows_written": 0,
+            "rows_failed": 0,
+            "rows_rejected": 0,
+            "flushes": 0,
+            "last_flush_rows": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    def start(self):
+        """Start the background flush task on the running event loop"""
+        if self._task and not self._task.done():
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, device_id: str, telemetry_data: Dict[str, Any], source: str = "mqtt"):
+        """Queue one telemetry record, waiting if the queue is full"""
+        if self._stopping:
+            raise RuntimeError("Telemetry writer is closed")
+        self.start()
+        row = supabase_service.build_telemetry_row(device_id, telemetry_data, source)
+        await self._queue.put(row)
+        self._stats["rows_submitted"] += 1
+
+    async def _run(self):
+        """Collect batches and flush them until the writer is closed"""
+        while not self._stopping:
+            batch = await self._collect()
+            if batch:
+                await self._flush(batch)
+
+    async def _collect(self) -> List[Dict[str, Any]]:
+        """Gather rows until the batch is full or the interval expires"""
+        loop = asyncio.get_running_loop()
+        batch: List[Dict[str, Any]] = []
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stopping:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        """Write one batch and record its size and latency"""
+        started = time.perf_counter()
+        await self._insert(batch)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._stats["flushes"] += 1
+        self._stats["last_flush_rows"] = len(batch)
+        self._stats["last_flush_ms"] = round(elapsed_ms, 3)
+        self._stats["max_flush_ms"] = round(max(self._stats["max_flush_ms"], elapsed_ms), 3)
+        self._stats["total_flush_ms"] += elapsed_ms
+
+    async def _insert(self, rows: List[Dict[str, Any]]):
+        """Insert rows; a rejected batch is bisected down to the rows that fail on their own"""
+        try:
+            await supabase_service.create_telemetry_batch(rows)
+            self._stats["rows_written"] += len(rows)
+        except APIError as e:
+            # The whole insert was rolled back, so retrying the halves cannot duplicate rows
+            if len(rows) == 1:
+                self._stats["rows_failed"] += 1
+                self._stats["rows_rejected"] += 1
+                print(f"Dropping telemetry row for device {rows[0]['device_id']}: {e}")
+                return
+            mid = len(rows) // 2
+            await self._insert(rows[:mid])
+            await self._insert(rows[mid:])
+        except Exception as e:
+            # Timeout or transport error: the insert may have landed, so it is not retried
+            self._stats["rows_failed"] += len(rows)
+            print(f"Error flushing telemetry batch of {len(rows)} rows: {e}")
+
+    async def flush(self):
+        """Flush everything currently queued"""
+        if self._queue is None:
+            return
+        while not self._queue.empty():
+            batch = []
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._flush(batch)
+
+    async def close(self):
+        """Stop the flush task and write out any remaining rows"""
+        self._stopping = True
+        if self._task:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return writer counters, including rows per flush and flush latency"""
+        flushes = self._stats["flushes"]
+        return {
+            **self._stats,
+            "total_flush_ms": round(self._stats["total_flush_ms"], 3),
+            "avg_rows_per_flush": round((self._stats["rows_written"] + self._stats["rows_failed"]) / flushes, 2) if flushes else 0.0,
+            "avg_flush_ms": round(self._stats["total_flush_ms"] / flushes, 3) if flushes else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_capacity": self.max_queue,
+        }
+
+# Create a singleton instance
+telemetry_writer = TelemetryBatchWriter()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Tests import the backend as `app`, whatever directory pytest is started from
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
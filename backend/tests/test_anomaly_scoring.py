@@ -0,0 +1,34 @@
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import anomaly
+from app.services import anomaly_detection
+from app.services.anomaly_detection import DeviceTypeModels
+
+
+def _client(tmp_path, monkeypatch):
+    models = DeviceTypeModels(root=tmp_path)
+    rng = np.random.default_rng(0)
+    models.train("inverter", {"power": rng.normal(5000, 100, 200).tolist()})
+    monkeypatch.setattr(anomaly_detection, "device_type_models", models)
+    monkeypatch.setattr(anomaly, "device_type_models", models)
+    app = FastAPI()
+    app.include_router(anomaly.router, prefix="/api/anomaly")
+    return TestClient(app)
+
+
+def test_unscored_rows_come_back_as_null(tmp_path, monkeypatch):
+    client = _client(tmp_path, monkeypatch)
+    response = client.post("/api/anomaly/score", json={
+        "device_types": ["inverter", "meter", "../x"],
+        "metrics": {"power": [5000.0, 10.0, 10.0]},
+    })
+
+    assert response.status_code == 200
+    body = response.json()
+    assert isinstance(body["score"][0], float)
+    assert body["score"][1:] == [None, None]
+    assert body["scored"] == [True, False, False]
+    assert body["is_anomaly"][1:] == [False, False]
+    assert body["untrained_types"] == ["meter"]
+    assert body["invalid_types"] == ["../x"]
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+from app.services.ingestion_bridge import MQTTIngestionBridge
+
+
+def _stalled_bridge(**kwargs):
+    release = asyncio.Event()
+
+    async def handler(topic, payload):
+        await release.wait()
+
+    return MQTTIngestionBridge(handler, queue_size=1, workers=1, overflow_policy="block", **kwargs)
+
+
+def test_block_policy_gives_up_after_timeout():
+    async def run():
+        bridge = _stalled_bridge(block_timeout=0.1)
+        bridge.start()
+        # One message held by the worker, one filling the queue, one that cannot fit
+        producer = threading.Thread(target=lambda: [bridge.submit("t", b"") for _ in range(3)])
+        producer.start()
+        await asyncio.to_thread(producer.join, 5)
+        alive = producer.is_alive()
+        await bridge.close(drain_timeout=0.1)
+        return alive, bridge.stats()
+
+    alive, stats = asyncio.run(run())
+    assert not alive
+    assert stats["dropped_block_timeout"] == 1
+
+
+def test_close_releases_blocked_producer():
+    async def run():
+        bridge = _stalled_bridge(block_timeout=60)
+        bridge.start()
+        producer = threading.Thread(target=lambda: [bridge.submit("t", b"") for _ in range(3)])
+        producer.start()
+        while not bridge._blocked:
+            await asyncio.sleep(0.01)
+        await bridge.close(drain_timeout=0.1)
+        # Joining paho's thread after close must not hang
+        await asyncio.to_thread(producer.join, 5)
+        return producer.is_alive(), bridge.stats()
+
+    alive, stats = asyncio.run(run())
+    assert not alive
+    assert stats["dropped_not_running"] == 1
+    assert stats["dropped_block_timeout"] == 0
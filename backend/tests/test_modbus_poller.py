@@ -0,0 +1,119 @@
+import asyncio
+import socket
+import time
+from app.agents.modbus_simulator import ModbusSimulator
+from app.agents.register_map import load_register_map
+from app.services.modbus_poller import ModbusPoller
+
+MODEL = "generic_hybrid_inverter"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _group_of(register_map, values):
+    groups = {spec.group for spec in register_map.registers if spec.name in values}
+    assert len(groups) == 1
+    return groups.pop()
+
+
+async def _run_poller(poller, simulator, seconds):
+    await simulator.start()
+    try:
+        poller.start()
+        await asyncio.sleep(seconds)
+        return poller.stats()
+    finally:
+        await poller.close()
+        await simulator.stop()
+
+
+def test_groups_poll_on_their_own_intervals():
+    register_map = load_register_map(MODEL)
+    port = _free_port()
+    simulator = ModbusSimulator(register_map, units=[1], port=port, update_interval=0)
+    polls = {}
+
+    async def sink(device_id, values):
+        group = _group_of(register_map, values)
+        polls[group] = polls.get(group, 0) + 1
+
+    poller = ModbusPoller(sink, timeout=0.5)
+    poller.add_device("inv-1", register_map, unit=1, host="127.0.0.1", port=port,
+                      intervals={"fast": 0.1, "status": 0.5, "energy": 60})
+    asyncio.run(_run_poller(poller, simulator, 1.2))
+
+    # Exact counts depend on scheduling; the ordering and the single 60 s poll do not
+    assert polls["fast"] > polls["status"] >= 1
+    assert polls["energy"] == 1
+
+
+def test_requests_on_one_bus_never_overlap():
+    register_map = load_register_map(MODEL)
+    port = _free_port()
+    simulator = ModbusSimulator(register_map, units=range(1, 5), port=port, update_interval=0)
+    poller = ModbusPoller(timeout=0.5)
+    for unit in range(1, 5):
+        poller.add_device(f"inv-{unit}", register_map, unit=unit, host="127.0.0.1", port=port,
+                          intervals={"fast": 0.05, "status": 0.05, "energy": 0.05})
+    bus = poller.buses[f"tcp://127.0.0.1:{port}"]
+    in_flight = {"now": 0, "max": 0}
+
+    def track(read):
+        async def wrapped(*args, **kwargs):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            try:
+                return await read(*args, **kwargs)
+            finally:
+                in_flight["now"] -= 1
+        return wrapped
+
+    bus.client.read_holding_registers = track(bus.client.read_holding_registers)
+    bus.client.read_input_registers = track(bus.client.read_input_registers)
+    stats = asyncio.run(_run_poller(poller, simulator, 0.5))
+
+    assert stats["buses"][bus.key]["requests"] > 1
+    assert in_flight["max"] == 1
+
+
+def test_silent_device_backs_off_without_stalling_others():
+    register_map = load_register_map(MODEL)
+    port = _free_port()
+    simulator = ModbusSimulator(register_map, units=[1, 2], port=port, silent_units=[2], update_interval=0)
+    reported = set()
+
+    async def sink(device_id, values):
+        reported.add(device_id)
+
+    poller = ModbusPoller(sink, timeout=0.05, backoff_after=2, backoff_base=30, backoff_max=60)
+    for unit in (1, 2):
+        poller.add_device(f"inv-{unit}", register_map, unit=unit, host="127.0.0.1", port=port,
+                          intervals={"fast": 0.05, "status": 0.05, "energy": 0.05})
+    stats = asyncio.run(_run_poller(poller, simulator, 1.0))
+
+    silent = poller.buses[f"tcp://127.0.0.1:{port}"].devices["inv-2"]
+    assert reported == {"inv-1"}
+    assert stats["in_backoff"] == 1
+    assert silent.backoff_until > time.monotonic() + 20
+    assert stats["buses"][f"tcp://127.0.0.1:{port}"]["skipped_backoff"] > 0
+
+
+def test_load_devices_reads_device_columns():
+    poller = ModbusPoller()
+    added = poller.load_devices([
+        {"id": "a", "protocol": "modbus", "type": "inverter", "ip_address": "10.0.0.5", "port": 1502, "slave_id": 7},
+        {"id": "b", "protocol": "modbus", "type": "inverter", "ip_address": "10.0.0.5", "port": 1502, "slave_id": 8,
+         "metadata": {"modbus": {"intervals": {"fast": 2}}}},
+        {"id": "c", "protocol": "mqtt", "type": "inverter"},
+        {"id": "d", "protocol": "modbus", "type": "inverter"},
+    ])
+
+    assert added == 2
+    bus = poller.buses["tcp://10.0.0.5:1502"]
+    assert bus.devices["a"].unit == 7
+    assert bus.devices["b"].groups["fast"][0] == 2
+    assert bus.devices["a"].register_map.model == MODEL
@@ -0,0 +1,21 @@
+import asyncio
+import pytest
+from app.services.broadcast_hub import ClientConnection
+from app.services.telemetry_stream import TelemetryStream
+
+
+@pytest.mark.parametrize("devices", [[["x"]], "d2", [1]])
+def test_bad_subscribe_keeps_existing_subscription(devices):
+    async def run():
+        stream = TelemetryStream()
+        client = ClientConnection(None, 10)
+        stream.handle(client, {"action": "subscribe", "devices": ["d1"]})
+        with pytest.raises(ValueError):
+            stream.handle(client, {"action": "subscribe", "devices": devices})
+        stats = stream.stats()
+        stream._task.cancel()
+        return stats, stream._subs[client].devices
+
+    stats, subscribed = asyncio.run(run())
+    assert stats["indexed_devices"] == 1
+    assert subscribed == {"d1"}
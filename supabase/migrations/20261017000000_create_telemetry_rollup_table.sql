@@ -0,0 +1,98 @@
+-- Create telemetry_rollup table: per device/metric aggregates at 1m, 15m and 1h resolution
+CREATE TABLE IF NOT EXISTS telemetry_rollup (
+    device_id UUID REFERENCES devices(id) ON DELETE CASCADE,
+    metric TEXT NOT NULL,
+    resolution TEXT NOT NULL CHECK (resolution IN ('1m', '15m', '1h')),
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+    min DOUBLE PRECISION NOT NULL,
+    max DOUBLE PRECISION NOT NULL,
+    mean DOUBLE PRECISION NOT NULL,
+    last DOUBLE PRECISION NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (device_id, metric, resolution, bucket_start)
+);
+
+-- Range scans per device and resolution
+CREATE INDEX IF NOT EXISTS idx_telemetry_rollup_device_resolution_start
+    ON telemetry_rollup(device_id, resolution, bucket_start);
+
+-- Enable RLS
+ALTER TABLE telemetry_rollup ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view rollups for their devices"
+    ON telemetry_rollup FOR SELECT
+    USING (
+        EXISTS (
+            SELECT 1 FROM devices
+            WHERE devices.id = telemetry_rollup.device_id
+            AND devices.user_id = auth.uid()
+        )
+    );
+
+CREATE POLICY "Service role can write rollups"
+    ON telemetry_rollup FOR ALL
+    TO service_role
+    USING (true)
+    WITH CHECK (true);
+
+-- Flush batches already merged, so a batch re-sent after a client-side timeout is
+-- applied at most once; ids older than a day are pruned by the merge function
+CREATE TABLE IF NOT EXISTS telemetry_rollup_batches (
+    batch_id UUID PRIMARY KEY,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_telemetry_rollup_batches_applied_at
+    ON telemetry_rollup_batches(applied_at);
+
+-- No policies: only the service role (which bypasses RLS) touches it
+ALTER TABLE telemetry_rollup_batches ENABLE ROW LEVEL SECURITY;
+
+-- Merge closed buckets into stored ones, so a bucket written in parts (e.g. across
+-- a backend restart) keeps every sample instead of the last part replacing the rest.
+-- Returns the number of buckets merged, or 0 when p_batch_id was already applied.
+CREATE OR REPLACE FUNCTION merge_telemetry_rollups(p_batch_id UUID, p_rows JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    merged_count INTEGER;
+BEGIN
+    INSERT INTO telemetry_rollup_batches (batch_id) VALUES (p_batch_id)
+    ON CONFLICT (batch_id) DO NOTHING;
+    IF NOT FOUND THEN
+        RETURN 0;
+    END IF;
+
+    DELETE FROM telemetry_rollup_batches
+    WHERE applied_at < timezone('utc'::text, now()) - INTERVAL '1 day';
+
+    WITH merged AS (
+        INSERT INTO telemetry_rollup AS r (device_id, metric, resolution, bucket_start, min, max, mean, last, count)
+        SELECT x.device_id, x.metric, x.resolution, x.bucket_start, x.min, x.max, x.mean, x.last, x.count
+        FROM jsonb_to_recordset(p_rows) AS x(
+            device_id UUID,
+            metric TEXT,
+            resolution TEXT,
+            bucket_start TIMESTAMP WITH TIME ZONE,
+            min DOUBLE PRECISION,
+            max DOUBLE PRECISION,
+            mean DOUBLE PRECISION,
+            last DOUBLE PRECISION,
+            count INTEGER
+        )
+        ON CONFLICT (device_id, metric, resolution, bucket_start) DO UPDATE SET
+            min = LEAST(r.min, EXCLUDED.min),
+            max = GREATEST(r.max, EXCLUDED.max),
+            mean = (r.mean * r.count + EXCLUDED.mean * EXCLUDED.count) / (r.count + EXCLUDED.count),
+            last = EXCLUDED.last,
+            count = r.count + EXCLUDED.count
+        RETURNING 1
+    )
+    SELECT count(*)::INTEGER INTO merged_count FROM merged;
+    RETURN merged_count;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION merge_telemetry_rollups(UUID, JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION merge_telemetry_rollups(UUID, JSONB) TO service_role;